@@ -0,0 +1,29 @@
+"""beneficiary nickname unique index
+
+Revision ID: 3f1c2a9b7d10
+Revises: 
+Create Date: 2026-10-15 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9b7d10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS beneficiary_user_nick_ci "
+        "ON beneficiaries (user_id, lower(nickname))"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS beneficiary_user_nick_ci")
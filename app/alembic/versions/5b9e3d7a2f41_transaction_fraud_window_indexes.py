@@ -0,0 +1,34 @@
+"""transaction fraud window indexes
+
+Revision ID: 5b9e3d7a2f41
+Revises: c72e19f4a3d8
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b9e3d7a2f41'
+down_revision: Union[str, None] = 'c72e19f4a3d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_transaction_user_created "
+        "ON transactions (user_id, created_at)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_transaction_user_recipient_created "
+        "ON transactions (user_id, recipient_phone, created_at)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_transaction_user_recipient_created")
+    op.execute("DROP INDEX IF EXISTS ix_transaction_user_created")
@@ -0,0 +1,29 @@
+"""beneficiary listing index
+
+Revision ID: 8a4d6e2c1b57
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-15 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4d6e2c1b57'
+down_revision: Union[str, None] = '3f1c2a9b7d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_beneficiary_user_type_created "
+        "ON beneficiaries (user_id, beneficiary_type, created_at DESC)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_beneficiary_user_type_created")
@@ -0,0 +1,29 @@
+"""beneficiary type utility values
+
+Revision ID: c72e19f4a3d8
+Revises: 8a4d6e2c1b57
+Create Date: 2026-10-15 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c72e19f4a3d8'
+down_revision: Union[str, None] = '8a4d6e2c1b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLAlchemy stores enum member names
+    for name in ("WATER", "INTERNET", "TV", "MUNICIPAL", "OTHER"):
+        op.execute(f"ALTER TYPE beneficiarytype ADD VALUE IF NOT EXISTS '{name}'")
+
+
+def downgrade() -> None:
+    # Postgres cannot drop values from an enum type
+    pass
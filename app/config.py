@@ -51,6 +51,8 @@ class Settings(BaseSettings):
     WHATSAPP_API_URL: str
     WHATSAPP_API_KEY: str
     WHATSAPP_PHONE_NUMBER_ID: str
+    WHATSAPP_MPS: float = 80.0  # Outbound messages/second quota (Cloud API default tier)
+    WHATSAPP_MAX_DOWNLOADS: int = 8  # Media downloads streamed at once
     
     # Feature Flags (NEW!)
     ENABLE_VOICE_NOTES: bool = True
@@ -67,6 +69,7 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7
     PIN_ENCRYPTION_KEY: str
+    BCRYPT_ROUNDS: int = 12  # PIN hashing cost (passlib default)
     
     # Transaction Limits (in ZAR)
     MAX_TRANSACTION_AMOUNT: float = 5000.00
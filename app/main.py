@@ -50,6 +50,14 @@ async def startup_event():
         os.makedirs("logs", exist_ok=True)
         os.makedirs("media", exist_ok=True)
         
+        # Build the messaging clients inside the running loop and pre-open
+        # their connections concurrently (failures only log)
+        from app.services.twilio_service import get_twilio
+        from app.services.whatsapp_api_service import get_whatsapp_api
+        from app.services.whatsapp_service import get_whatsapp_service
+        await get_whatsapp_service().startup()
+        await asyncio.gather(get_whatsapp_api().warm_up(), get_twilio().warm_up())
+        
         logger.info("Cyrax startup complete!")
         
     except Exception as e:
@@ -61,6 +69,14 @@ async def startup_event():
 async def shutdown_event():
     """Run on application shutdown."""
     logger.info("Shutting down Cyrax...")
+    
+    from app.services.payment_service import paystack_service
+    from app.services.whatsapp_service import get_whatsapp_service
+    from app.services import _http
+    await paystack_service.aclose()
+    await get_whatsapp_service().aclose()
+    # Twilio + both WhatsApp clients share one transport
+    await _http.aclose()
 
 
 @app.get("/", response_class=PlainTextResponse)
@@ -2,7 +2,7 @@
 Beneficiary Model
 Save frequently used phone numbers and meter numbers
 """
-from sqlalchemy import Column, String, ForeignKey, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, ForeignKey, DateTime, Index, Enum as SQLEnum, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -17,6 +17,11 @@ class BeneficiaryType(str, enum.Enum):
     PHONE = "phone"  # For airtime/data
     METER = "meter"  # For electricity
     ACCOUNT = "account"  # For bills
+    WATER = "water"  # Water utility accounts
+    INTERNET = "internet"  # WiFi / fibre accounts
+    TV = "tv"  # DStv and other TV subscriptions
+    MUNICIPAL = "municipal"  # Council rates and services
+    OTHER = "other"
 
 
 class Beneficiary(Base):
@@ -40,5 +45,12 @@ class Beneficiary(Base):
     # Relationships
     user = relationship("User", back_populates="beneficiaries")
     
+    __table_args__ = (
+        # Nicknames are unique per user, case-insensitive (backs ON CONFLICT in save_beneficiary)
+        Index("beneficiary_user_nick_ci", user_id, func.lower(nickname), unique=True),
+        # Order-preserving scan for get_beneficiaries
+        Index("ix_beneficiary_user_type_created", user_id, beneficiary_type, created_at.desc()),
+    )
+    
     def __repr__(self):
         return f"<Beneficiary {self.nickname}: {self.value}>"
\ No newline at end of file
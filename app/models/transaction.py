@@ -2,7 +2,7 @@
 Transaction Model
 Stores all financial transactions with full audit trail
 """
-from sqlalchemy import Column, String, DateTime, Float, Integer, ForeignKey, Enum as SQLEnum, Text
+from sqlalchemy import Column, String, DateTime, Float, Integer, ForeignKey, Enum as SQLEnum, Text, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -103,6 +103,12 @@ class Transaction(Base):
     completed_at = Column(DateTime, nullable=True)
     failed_at = Column(DateTime, nullable=True)
     
+    __table_args__ = (
+        # Per-user time windows for fraud checks
+        Index("ix_transaction_user_created", user_id, created_at),
+        Index("ix_transaction_user_recipient_created", user_id, recipient_phone, created_at),
+    )
+    
     def __repr__(self):
         return f"<Transaction {self.id} - {self.type} - {self.status}>"
     
@@ -118,15 +124,20 @@ class Transaction(Base):
     
     def to_dict(self) -> dict:
         """Convert transaction to dictionary for API responses"""
+        return Transaction.serialize(self)
+    
+    @staticmethod
+    def serialize(t) -> dict:
+        """API dictionary from a Transaction or a row projecting its columns"""
         return {
-            "id": str(self.id),
-            "type": self.type.value,
-            "status": self.status.value,
-            "amount": self.amount,
-            "total_amount": self.total_amount,
-            "currency": self.currency,
-            "description": self.description,
-            "recipient_name": self.recipient_name,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "id": str(t.id),
+            "type": t.type.value,
+            "status": t.status.value,
+            "amount": t.amount,
+            "total_amount": t.total_amount,
+            "currency": t.currency,
+            "description": t.description,
+            "recipient_name": t.recipient_name,
+            "created_at": t.created_at.isoformat() if t.created_at else None,
+            "completed_at": t.completed_at.isoformat() if t.completed_at else None,
         }
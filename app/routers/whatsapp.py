@@ -5,18 +5,19 @@ Handles text, voice notes, and images via Twilio WhatsApp
 from fastapi import APIRouter, Request, Depends, BackgroundTasks
 from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
-from typing import Optional, Dict
+from typing import Dict, Mapping, Optional
 import logging
+import msgspec
+import orjson
 from datetime import datetime
-import aiofiles
 import os
 from pathlib import Path
-import httpx
 
-from app.database import get_db
+from app.database import get_db, AsyncSessionLocal
 from app.models.user import User, UserStatus
 from app.models.conversation import Conversation
-from app.services.whatsapp_api_service import whatsapp_api  # ← UPDATED: WhatsApp API
+from app.services.twilio_service import TwilioWhatsAppService
+from app.services.whatsapp_api_service import get_whatsapp_api  # ← UPDATED: WhatsApp API (lazy singleton)
 from app.services.transaction_service import transaction_service
 from app.services.security_service import security_service
 from app.services.onboarding_service import onboarding_service
@@ -55,17 +56,22 @@ async def receive_webhook(
 ):
     """Main webhook endpoint for receiving WhatsApp messages."""
     try:
-        # Try to parse as JSON first (WhatsApp API format)
+        body = await request.body()
+        # Try to parse as JSON first (WhatsApp API format) - typed, single-pass decode
         try:
-            data = await request.json()
-            logger.info(f"Webhook received (JSON): {data}")
-            message = whatsapp_api.parse_webhook(data)
-        except:
-            # Fallback to form data (Twilio format - for backwards compatibility)
-            form_data = await request.form()
-            logger.info(f"Webhook received (Form): {dict(form_data)}")
-            # Convert form to dict for parsing
-            message = whatsapp_api.parse_webhook(dict(form_data))
+            message = await get_whatsapp_api().parse_webhook_bytes_async(body)
+            logger.info(f"Webhook received (JSON): {body.decode(errors='replace')}")
+        except msgspec.ValidationError as e:
+            # Valid JSON with an off-type field: still a Cloud API payload, so
+            # re-parse it leniently rather than treating it as a Twilio form
+            logger.warning(f"Webhook schema mismatch, using dict parser: {str(e)}")
+            message = get_whatsapp_api().parse_webhook(orjson.loads(body))
+        except msgspec.DecodeError:
+            # Fallback to form data (Twilio format - for backwards compatibility),
+            # decoded from the same raw body keeping only the fields we read
+            form_data = TwilioWhatsAppService.webhook_form(body)
+            logger.info(f"Webhook received (Form): {form_data}")
+            message = TwilioWhatsAppService.parse_webhook(form_data)
         
         if not message:
             return PlainTextResponse("OK")
@@ -135,10 +141,11 @@ async def process_message(message: dict, db: Session):
             
             # Handle Flow response
             if message_text == "FLOW_RESPONSE":
-                flow_data_json = message.get("flow_data", "{}")
+                # Already decoded by parse_webhook
+                flow_data = message.get("flow_data", {})
                 try:
-                    import json
-                    flow_data = json.loads(flow_data_json)
+                    if flow_data is None:
+                        raise ValueError("Malformed Flow response JSON")
                     
                     # Process onboarding with Flow data
                     success, msg, updated_user = await onboarding_service.process_flow_response(
@@ -147,7 +154,7 @@ async def process_message(message: dict, db: Session):
                         db
                     )
                     
-                    await whatsapp_api.send_message(phone_number, msg)
+                    await get_whatsapp_api().send_message(phone_number, msg)
                     
                     if success:
                         await send_menu(phone_number)
@@ -155,7 +162,7 @@ async def process_message(message: dict, db: Session):
                     return
                 except Exception as e:
                     logger.error(f"Flow processing error: {str(e)}")
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         "❌ Registration error. Please try again."
                     )
@@ -170,7 +177,7 @@ async def process_message(message: dict, db: Session):
                     user.is_fica_compliant = False
                     user.status = UserStatus.PENDING_VERIFICATION
                     db.commit()
-                    await whatsapp_api.send_message(phone_number, "✅ Account reset. Send 'Hi' to start fresh.")
+                    await get_whatsapp_api().send_message(phone_number, "✅ Account reset. Send 'Hi' to start fresh.")
                     return
                 
                 elif message_text.startswith("/complete"):
@@ -183,54 +190,50 @@ async def process_message(message: dict, db: Session):
                     user.is_id_verified = True
                     user.status = UserStatus.ACTIVE
                     db.commit()
-                    await whatsapp_api.send_message(phone_number, "✅ Account activated!")
+                    await get_whatsapp_api().send_message(phone_number, "✅ Account activated!")
                     return
             
             # Handle button responses (yes/no from confirmations + menu buttons)
-            if message_text.lower() in ["yes", "no", "info", "airtime", "data", "electricity"]:
-                if message_text.lower() == "yes":
+            button_reply = message_text.lower()
+            if button_reply in ["yes", "no", "info", "airtime", "data", "electricity"]:
+                if button_reply == "yes":
                     # User confirmed - process transaction
-                    await whatsapp_api.send_delay()
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         "✅ Processing your request...\n\n⚠️ Note: Your wallet balance is R0.00. Please top up to complete purchases."
                     )
                     return
-                elif message_text.lower() == "no":
+                elif button_reply == "no":
                     # User declined
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         "❌ Transaction cancelled. Let me know if you need anything else!"
                     )
                     return
-                elif message_text.lower() == "info":
+                elif button_reply == "info":
                     # User wants more info
-                    await whatsapp_api.send_delay()
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         "ℹ️ *About Cyrax*\n\nI help you:\n• Buy airtime for any SA network\n• Get data bundles\n• Pay electricity bills\n\nSecure, fast, and easy! 🔐\n\nReady to register? Reply YES"
                     )
                     return
-                elif message_text.lower() == "airtime":
+                elif button_reply == "airtime":
                     # User clicked Buy Airtime button
-                    await whatsapp_api.send_delay()
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         "📱 *Buy Airtime*\n\nTell me:\n• Phone number\n• Amount (R5 - R1000)\n• Network (optional)\n\nExample: \"Buy R50 MTN airtime for 0821234567\"\n\nOr send a photo of the number!"
                     )
                     return
-                elif message_text.lower() == "data":
+                elif button_reply == "data":
                     # User clicked Buy Data button
-                    await whatsapp_api.send_delay()
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         "📊 *Buy Data*\n\nTell me:\n• Phone number\n• Data amount (1GB, 2GB, etc.)\n• Network\n\nExample: \"Buy 1GB Vodacom data for 0821234567\""
                     )
                     return
-                elif message_text.lower() == "electricity":
+                elif button_reply == "electricity":
                     # User clicked Recharge Meter button
-                    await whatsapp_api.send_delay()
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         "⚡ *Recharge Meter*\n\nTell me:\n• Meter number (11 digits)\n• Amount (R10 - R5000)\n\nExample: \"Pay R100 electricity for meter 12345678901\"\n\nOr send a photo of your meter!"
                     )
@@ -240,7 +243,7 @@ async def process_message(message: dict, db: Session):
             # Download and transcribe voice note
             message_text = await handle_voice_note(message)
             if not message_text:
-                await whatsapp_api.send_message(
+                await get_whatsapp_api().send_message(
                     phone_number,
                     "Sorry, I couldn't understand your voice note. Please try again or send a text message. 🎤"
                 )
@@ -260,7 +263,7 @@ async def process_message(message: dict, db: Session):
                 
                 # Check if extraction was successful
                 if confidence < 0.5:
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         "📸 I can see your image, but it's not clear enough. Please try:\n• Better lighting\n• Closer shot\n• Focus on the numbers"
                     )
@@ -279,7 +282,7 @@ async def process_message(message: dict, db: Session):
                     if phone:
                         # If amount already provided in caption, confirm with buttons
                         if amount and intent == "airtime":
-                            await whatsapp_api.send_buttons(
+                            await get_whatsapp_api().send_buttons(
                                 phone_number,
                                 f"📱 Confirm Airtime Purchase\n\n• Phone: {phone}\n• Network: {provider}\n• Amount: {amount}\n\nReady to proceed?",
                                 [
@@ -290,13 +293,13 @@ async def process_message(message: dict, db: Session):
                             return  # Don't process with AI
                         else:
                             # Amount missing - ask for it
-                            await whatsapp_api.send_message(
+                            await get_whatsapp_api().send_message(
                                 phone_number,
                                 f"📱 I found:\n• Phone: {phone}\n• Network: {provider if provider != 'Unknown' else 'Will detect automatically'}\n\n💰 How much airtime? (e.g., R10, R20, R50, R100)"
                             )
                             return  # Don't process with AI
                     else:
-                        await whatsapp_api.send_message(
+                        await get_whatsapp_api().send_message(
                             phone_number,
                             "📱 I see a phone number but couldn't read it clearly. Please type it or send a clearer photo."
                         )
@@ -308,14 +311,14 @@ async def process_message(message: dict, db: Session):
                     provider = extracted_data.get("provider", "Eskom")
                     
                     if meter:
-                        await whatsapp_api.send_message(
+                        await get_whatsapp_api().send_message(
                             phone_number,
                             f"⚡ I found:\n• Meter: {meter}\n• Provider: {provider}\n\nHow much electricity would you like to buy? (e.g., R50, R100)"
                         )
                         # Set intent for electricity purchase
                         message_text = f"buy electricity for meter {meter}"
                     else:
-                        await whatsapp_api.send_message(
+                        await get_whatsapp_api().send_message(
                             phone_number,
                             "⚡ I see an electricity meter but couldn't read the number. Please type it or send a clearer photo."
                         )
@@ -334,14 +337,14 @@ async def process_message(message: dict, db: Session):
                         bill_msg += f"• Amount Due: {amount}\n"
                     bill_msg += "\nWould you like to pay this bill? Reply YES to confirm."
                     
-                    await whatsapp_api.send_message(phone_number, bill_msg)
+                    await get_whatsapp_api().send_message(phone_number, bill_msg)
                     # Set intent for bill payment
                     message_text = f"pay {provider} bill for account {account} amount {amount}"
                 
                 # UNKNOWN/UNCLEAR IMAGE
                 else:
                     description = extracted_data.get("description", "an image")
-                    await whatsapp_api.send_message(
+                    await get_whatsapp_api().send_message(
                         phone_number,
                         f"📸 I see {description}, but I couldn't identify:\n• Phone number (for airtime)\n• Meter number (for electricity)\n• Utility bill (for payment)\n\nPlease try:\n✓ Close-up of the number\n✓ Good lighting\n✓ Clear focus"
                     )
@@ -349,14 +352,14 @@ async def process_message(message: dict, db: Session):
                     message_text = "help"
             
             else:
-                await whatsapp_api.send_message(
+                await get_whatsapp_api().send_message(
                     phone_number,
                     "Sorry, I couldn't process your image. Please try again with a clearer photo! 📸"
                 )
                 return
         
         else:
-            await whatsapp_api.send_message(
+            await get_whatsapp_api().send_message(
                 phone_number,
                 f"I support text messages, voice notes, and images. Please send one of these! 💬🎤📸"
             )
@@ -380,7 +383,8 @@ async def process_message(message: dict, db: Session):
             "phone": user.phone_number,
             "balance": user.balance,
             "status": user.status.value,
-            "is_verified": user.is_fica_compliant  # NEW: Include FICA status
+            "is_verified": user.is_fica_compliant,  # NEW: Include FICA status
+            "language": user.preferred_language
         }
         
         # Get conversation history
@@ -407,23 +411,23 @@ async def process_message(message: dict, db: Session):
             # Re-classify with the confirmed intent
             message_text = action
         elif message_text == "cancel_typo":
-            await whatsapp_api.send_message(
+            await get_whatsapp_api().send_message(
                 phone_number,
                 "Got it! What would you like to do?"
             )
             return
         
         classification = classify_intent(message_text, str(user.id), db)
-        logger.info(f"Intent classified: {classification['intent']} (confidence: {classification['confidence']})")
+        logger.info(f"Intent classified: {classification.intent} (confidence: {classification.confidence})")
         
         # STEP 2: If we have a direct handler and don't need AI, execute immediately
-        if classification["handler"] and not classification["use_ai"]:
-            handler_name = classification["handler"]
+        if classification.handler and not classification.use_ai:
+            handler_name = classification.handler
             
             if handler_name == "handle_typo_confirmation":
                 # Ask user to confirm the typo correction
-                suggested = classification.get("suggested_intent", "")
-                await whatsapp_api.send_buttons(
+                suggested = classification.suggested_intent or ""
+                await get_whatsapp_api().send_buttons(
                     phone_number,
                     f"Did you mean: *{suggested.title()}*?",
                     [
@@ -446,7 +450,7 @@ async def process_message(message: dict, db: Session):
                 return
             
             elif handler_name == "handle_check_balance":
-                await whatsapp_api.send_message(
+                await get_whatsapp_api().send_message(
                     phone_number,
                     f"💰 *Wallet Balance*\n\nCurrent balance: R{user.balance:.2f}"
                 )
@@ -467,7 +471,7 @@ async def process_message(message: dict, db: Session):
                 if user.account_number:
                     details += f"Account: {user.account_number}\n"
                 
-                await whatsapp_api.send_message(phone_number, details)
+                await get_whatsapp_api().send_message(phone_number, details)
                 return
             
             elif handler_name == "send_menu":
@@ -479,7 +483,7 @@ async def process_message(message: dict, db: Session):
                     phone_number, 
                     message_text, 
                     user.id, 
-                    classification["entities"],
+                    classification.entities,
                     db
                 )
                 return
@@ -489,7 +493,7 @@ async def process_message(message: dict, db: Session):
                     phone_number,
                     message_text,
                     user.id,
-                    classification["entities"],
+                    classification.entities,
                     db
                 )
                 return
@@ -517,7 +521,7 @@ async def process_message(message: dict, db: Session):
             logger.warning(f"Hallucination caught and corrected")
         
         # Send validated response
-        await whatsapp_api.send_message(phone_number, final_response)
+        await get_whatsapp_api().send_message(phone_number, final_response)
         
         # Handle specific intents - only send menu for actual help requests
         if ai_result["intent"] == "help":
@@ -539,7 +543,7 @@ async def process_message(message: dict, db: Session):
         
     except Exception as e:
         logger.error(f"Message processing error: {str(e)}", exc_info=True)
-        await whatsapp_api.send_message(
+        await get_whatsapp_api().send_message(
             phone_number,
             "Sorry, something went wrong. Please try again later. 😅"
         )
@@ -556,7 +560,7 @@ To keep your account secure, please lock your WhatsApp. 🔒
 Ready to get started? Let's begin your onboarding! ✨"""
     
     # Send Flow for registration
-    await whatsapp_api.send_flow(
+    await get_whatsapp_api().send_flow(
         phone_number,
         welcome,
         "Complete Onboarding",
@@ -588,7 +592,7 @@ REGISTER Thabo Mokoena 9001011234567
 
 Ready? Send your details now! 👆"""
     
-    await whatsapp_api.send_message(phone_number, instructions)
+    await get_whatsapp_api().send_message(phone_number, instructions)
 
 
 async def handle_registration(phone_number: str, message_text: str, user: User, db: Session):
@@ -601,7 +605,7 @@ async def handle_registration(phone_number: str, message_text: str, user: User,
         parts = message_text.strip().split()
         
         if len(parts) != 4:  # Changed from 5 to 4
-            await whatsapp_api.send_message(
+            await get_whatsapp_api().send_message(
                 phone_number,
                 """❌ *Invalid Format*
 
@@ -632,7 +636,7 @@ Try again! 👆"""
         )
         
         # Send result
-        await whatsapp_api.send_message(phone_number, message)
+        await get_whatsapp_api().send_message(phone_number, message)
         
         # If successful, send menu
         if success:
@@ -640,7 +644,7 @@ Try again! 👆"""
         
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
-        await whatsapp_api.send_message(
+        await get_whatsapp_api().send_message(
             phone_number,
             "❌ Something went wrong during registration. Please try again or contact support."
         )
@@ -730,44 +734,20 @@ async def download_media(media_url_or_id: str, message_id: str, extension: str)
     If media_url_or_id starts with digits, it's a media_id - fetch URL first.
     """
     try:
-        # Check if this is a media_id (all digits) or a URL
-        if media_url_or_id and not media_url_or_id.startswith("http"):
-            # It's a media_id, fetch the URL
-            logger.info(f"Fetching media URL for ID: {media_url_or_id}")
-            media_url = await whatsapp_api.get_media_url(media_url_or_id)
-            if not media_url:
-                logger.error("Failed to get media URL from media_id")
-                return None
-        else:
-            media_url = media_url_or_id
-        
-        if not media_url:
+        if not media_url_or_id:
             return None
         
-        # Download media with authentication
-        from app.config import settings
+        filepath = MEDIA_DIR / f"{message_id}.{extension}"
         
-        headers = {
-            "Authorization": f"Bearer {settings.WHATSAPP_API_KEY}"
-        }
+        # Streamed to disk over the pooled, authenticated client
+        if media_url_or_id.startswith("http"):
+            await get_whatsapp_api().download_url(media_url_or_id, filepath)
+        else:
+            # It's a media_id - resolve the URL first
+            logger.info(f"Fetching media URL for ID: {media_url_or_id}")
+            await get_whatsapp_api().download_media(media_url_or_id, filepath)
         
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get(
-                media_url,
-                headers=headers,
-                timeout=30.0
-            )
-            response.raise_for_status()
-            
-            # Save to file
-            filename = f"{message_id}.{extension}"
-            filepath = MEDIA_DIR / filename
-            
-            async with aiofiles.open(filepath, 'wb') as f:
-                await f.write(response.content)
-            
-            logger.info(f"Media downloaded: {filepath}")
-            return filepath
+        return filepath
             
     except Exception as e:
         logger.error(f"Media download error: {str(e)}")
@@ -776,10 +756,7 @@ async def download_media(media_url_or_id: str, message_id: str, extension: str)
 
 async def send_menu(phone_number: str):
     """Send menu with quick reply buttons."""
-    # Show typing
-    await whatsapp_api.send_delay()
-    
-    await whatsapp_api.send_buttons(
+    await get_whatsapp_api().send_buttons(
         phone_number,
         "How can I help you today?",
         [
@@ -805,7 +782,7 @@ async def handle_save_beneficiary(phone_number: str, message: str, user_id: str,
     parts = text.split()
     
     if len(parts) < 2:
-        await whatsapp_api.send_message(
+        await get_whatsapp_api().send_message(
             phone_number,
             "Please use format:\n• save [name] [number]\n\nExamples:\n• save thabo 0821234567\n• save home meter 12345678901\n• save mom number 0827654321"
         )
@@ -841,26 +818,28 @@ async def handle_save_beneficiary(phone_number: str, message: str, user_id: str,
             value = "+27" + value[1:]
     
     # Save
-    success, msg, beneficiary = beneficiary_service.save_beneficiary(
-        user_id=user_id,
-        nickname=nickname,
-        value=value,
-        beneficiary_type=btype,
-        network=None,
-        db=db
-    )
+    async with AsyncSessionLocal() as adb:
+        success, msg, beneficiary = await beneficiary_service.save_beneficiary_async(
+            user_id=user_id,
+            nickname=nickname,
+            value=value,
+            beneficiary_type=btype,
+            network=None,
+            db=adb
+        )
     
-    await whatsapp_api.send_message(phone_number, msg)
+    await get_whatsapp_api().send_message(phone_number, msg)
 
 
 async def handle_show_beneficiaries(phone_number: str, user_id: str, db: Session):
     """Show all saved beneficiaries"""
     from app.services.beneficiary_service import beneficiary_service
     
-    beneficiaries = beneficiary_service.get_beneficiaries(user_id, None, db)
+    async with AsyncSessionLocal() as adb:
+        beneficiaries = await beneficiary_service.get_beneficiaries_async(user_id, None, adb)
     message = beneficiary_service.format_beneficiary_list(beneficiaries)
     
-    await whatsapp_api.send_message(phone_number, message)
+    await get_whatsapp_api().send_message(phone_number, message)
 
 
 async def handle_delete_beneficiary(phone_number: str, message: str, user_id: str, db: Session):
@@ -871,21 +850,22 @@ async def handle_delete_beneficiary(phone_number: str, message: str, user_id: st
     nickname = message.lower().replace("delete ", "").replace("remove ", "").strip()
     
     if not nickname:
-        await whatsapp_api.send_message(
+        await get_whatsapp_api().send_message(
             phone_number,
             "Please specify which beneficiary to delete.\n\nExample: delete thabo"
         )
         return
     
-    success, msg = beneficiary_service.delete_beneficiary(user_id, nickname, db)
-    await whatsapp_api.send_message(phone_number, msg)
+    async with AsyncSessionLocal() as adb:
+        success, msg = await beneficiary_service.delete_beneficiary_async(user_id, nickname, adb)
+    await get_whatsapp_api().send_message(phone_number, msg)
 
 
 async def handle_beneficiary_transaction(
     phone_number: str, 
     message: str, 
     user_id: str,
-    entities: dict,
+    entities: Mapping,
     db: Session
 ):
     """
@@ -896,7 +876,7 @@ async def handle_beneficiary_transaction(
     amount = entities.get("amount")
     
     if not beneficiary:
-        await whatsapp_api.send_message(phone_number, "Beneficiary not found.")
+        await get_whatsapp_api().send_message(phone_number, "Beneficiary not found.")
         return
     
     # Get user for balance check
@@ -904,7 +884,7 @@ async def handle_beneficiary_transaction(
     
     # If amount missing, ask for it
     if not amount:
-        await whatsapp_api.send_message(
+        await get_whatsapp_api().send_message(
             phone_number,
             f"How much for {beneficiary.nickname}?\n\nExample: R50, R100, R200"
         )
@@ -912,7 +892,7 @@ async def handle_beneficiary_transaction(
     
     # Check balance
     if user.balance < amount:
-        await whatsapp_api.send_message(
+        await get_whatsapp_api().send_message(
             phone_number,
             f"💰 Insufficient balance\n\nYou have: R{user.balance:.2f}\nYou need: R{amount:.2f}\n\nPlease top up your wallet."
         )
@@ -930,7 +910,7 @@ async def handle_beneficiary_transaction(
         icon = "💳"
     
     # Send confirmation with buttons
-    await whatsapp_api.send_buttons(
+    await get_whatsapp_api().send_buttons(
         phone_number,
         f"{icon} *Confirm Purchase*\n\n• For: {beneficiary.nickname}\n• Account: {beneficiary.value}\n• Amount: R{amount:.2f}\n• Type: {transaction_type.title()}\n\nProceed?",
         [
@@ -944,7 +924,7 @@ async def handle_buy_airtime(
     phone_number: str,
     message_text: str,
     user_id: str,
-    entities: dict,
+    entities: Mapping,
     db: Session
 ):
     """
@@ -954,9 +934,10 @@ async def handle_buy_airtime(
     from app.services.intent_classifier import extract_amount, extract_phone, extract_network
     
     # Extract entities from message
-    amount = entities.get("amount") or extract_amount(message_text)
-    phone = entities.get("phone") or extract_phone(message_text)
-    network = entities.get("network") or extract_network(message_text)
+    text_lower = message_text.lower()
+    amount = entities.get("amount") or extract_amount(text_lower)
+    phone = entities.get("phone") or extract_phone(text_lower)
+    network = entities.get("network") or extract_network(text_lower)
     
     # Get user
     user = db.query(User).filter(User.id == user_id).first()
@@ -973,22 +954,22 @@ async def handle_buy_airtime(
     # If anything missing, ask for it
     if missing:
         if "network" in missing and "amount" in missing:
-            await whatsapp_api.send_message(
+            await get_whatsapp_api().send_message(
                 phone_number,
                 "Which network and how much?\n\nExample: R20 MTN"
             )
         elif "phone number" in missing:
-            await whatsapp_api.send_message(
+            await get_whatsapp_api().send_message(
                 phone_number,
                 f"For which number?\n\nExample: 0821234567"
             )
         elif "amount" in missing:
-            await whatsapp_api.send_message(
+            await get_whatsapp_api().send_message(
                 phone_number,
                 f"How much {network} airtime?\n\nExample: R20, R50, R100"
             )
         elif "network" in missing:
-            await whatsapp_api.send_buttons(
+            await get_whatsapp_api().send_buttons(
                 phone_number,
                 "Which network?",
                 [
@@ -1001,14 +982,14 @@ async def handle_buy_airtime(
     
     # Step 2: All info present - check balance
     if user.balance < amount:
-        await whatsapp_api.send_message(
+        await get_whatsapp_api().send_message(
             phone_number,
             f"⚠️ *Insufficient Balance*\n\nYou have: R{user.balance:.2f}\nYou need: R{amount:.2f}\n\nPlease top up to continue."
         )
         return
     
     # Step 3: Send confirmation buttons
-    await whatsapp_api.send_buttons(
+    await get_whatsapp_api().send_buttons(
         phone_number,
         f"📱 *Confirm Airtime Purchase*\n\n• Network: {network.title()}\n• Phone: {phone}\n• Amount: R{amount:.2f}\n\nProceed?",
         [
@@ -0,0 +1,86 @@
+"""
+WhatsApp Cloud API webhook payload types
+Typed msgspec structs for the fields parse_webhook reads; unknown fields are ignored.
+Scalar fields accept null (Meta sends e.g. "caption": null), so one off-type
+value doesn't reject the whole payload; readers coalesce None themselves
+"""
+from typing import List, Optional, Union
+
+import msgspec
+
+
+class Profile(msgspec.Struct):
+    name: Optional[str] = ""
+
+
+class Contact(msgspec.Struct):
+    profile: Profile = msgspec.field(default_factory=Profile)
+
+
+class Text(msgspec.Struct):
+    body: Optional[str] = ""
+
+
+class Media(msgspec.Struct):
+    """image / audio / video / document object"""
+    id: Optional[str] = ""
+    mime_type: Optional[str] = ""
+    caption: Optional[str] = ""
+
+
+class ButtonReply(msgspec.Struct):
+    id: Optional[str] = ""
+
+
+class NfmReply(msgspec.Struct):
+    """Flow (form) submission"""
+    response_json: Optional[str] = "{}"
+
+
+class Interactive(msgspec.Struct):
+    type: Optional[str] = ""
+    button_reply: ButtonReply = msgspec.field(default_factory=ButtonReply)
+    nfm_reply: NfmReply = msgspec.field(default_factory=NfmReply)
+
+
+class Message(msgspec.Struct):
+    from_: Optional[str] = msgspec.field(default="", name="from")
+    id: Optional[str] = ""
+    type: Optional[str] = "text"
+    timestamp: Union[str, int, None] = ""
+    text: Optional[Text] = None
+    image: Optional[Media] = None
+    audio: Optional[Media] = None
+    video: Optional[Media] = None
+    document: Optional[Media] = None
+    interactive: Optional[Interactive] = None
+
+
+class Value(msgspec.Struct):
+    messages: List[Message] = []
+    contacts: List[Contact] = []
+
+
+class Change(msgspec.Struct):
+    value: Value = msgspec.field(default_factory=Value)
+
+
+class Entry(msgspec.Struct):
+    changes: List[Change] = []
+
+
+class WebhookPayload(msgspec.Struct):
+    entry: List[Entry] = []
+
+
+_decoder = msgspec.json.Decoder(WebhookPayload)
+
+
+def decode_webhook(raw: bytes) -> WebhookPayload:
+    """Decode + validate a raw webhook body in one pass (raises msgspec.DecodeError)"""
+    return _decoder.decode(raw)
+
+
+def convert_webhook(data: dict) -> WebhookPayload:
+    """Build a WebhookPayload from an already-decoded dict"""
+    return msgspec.convert(data, WebhookPayload)
@@ -1,2 +1,2 @@
-from app.services.whatsapp_api_service import whatsapp_api
-__all__ = ["whatsapp_api", ...]
\ No newline at end of file
+from app.services.whatsapp_api_service import get_whatsapp_api
+__all__ = ["get_whatsapp_api", ...]
\ No newline at end of file
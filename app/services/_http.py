@@ -0,0 +1,27 @@
+"""
+Shared HTTP transport for the messaging services
+One TLS/HTTP2 connection pool behind the Twilio and WhatsApp API clients
+"""
+from functools import lru_cache
+
+import httpx
+
+
+@lru_cache(maxsize=1)
+def get_transport() -> httpx.AsyncHTTPTransport:
+    """
+    Process-wide pooled transport. Each service wraps it in its own
+    AsyncClient (own base_url/auth headers), so sockets, keep-alive and
+    HTTP/2 connections are pooled once instead of per service.
+    """
+    return httpx.AsyncHTTPTransport(
+        http2=True,
+        # Long keep-alive: bursts of sends reuse the warm TLS/HTTP2 connection
+        limits=httpx.Limits(max_connections=1000, max_keepalive_connections=200, keepalive_expiry=60)
+    )
+
+
+async def aclose() -> None:
+    """Close the shared pool (called on application shutdown)."""
+    if get_transport.cache_info().currsize:
+        await get_transport().aclose()
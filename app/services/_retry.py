@@ -0,0 +1,96 @@
+"""
+Retry helper for outbound messaging calls
+Exponential backoff with jitter; honours Retry-After when the server sends it
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upstream statuses worth another attempt for idempotent requests;
+# any other 4xx is the caller's fault
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Statuses where the server refused the request unprocessed: safe to resend
+# even a message send (a 500/502/504 may have been delivered already)
+SAFE_RETRY_STATUSES = frozenset({429, 503})
+
+# Transport errors raised before the request reached the server
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date), if any"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+async def retry_async(
+    fn: Callable[[], Awaitable[T]],
+    max_retries: int = 3,
+    base: float = 1.0,
+    cap: float = 30.0,
+    jitter: float = 0.5,
+    retry_statuses: Optional[frozenset] = None,
+    idempotent: bool = False
+) -> T:
+    """
+    Await fn() until it succeeds, retrying transient failures.
+
+    By default only failures where the request was never processed are
+    retried (connect errors, 429/503), so a non-idempotent send is never
+    delivered twice. idempotent=True also retries read/write timeouts and
+    5xx. Everything else is raised immediately. fn must call
+    raise_for_status() itself.
+
+    Args:
+        fn: Zero-argument coroutine factory (called once per attempt)
+        max_retries: Attempts in total, including the first
+        base: Backoff base in seconds (doubles every attempt)
+        cap: Upper bound on any single delay, Retry-After included
+        jitter: Extra random fraction added to each backoff delay
+        retry_statuses: HTTP statuses worth another attempt (default from idempotent)
+        idempotent: Whether fn is safe to repeat after it may have reached the server
+    """
+    if retry_statuses is None:
+        retry_statuses = RETRYABLE_STATUSES if idempotent else SAFE_RETRY_STATUSES
+    for attempt in range(max_retries):
+        try:
+            return await fn()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in retry_statuses or attempt + 1 >= max_retries:
+                raise
+            delay = _retry_after(e.response)
+            reason = f"HTTP {e.response.status_code}"
+        except httpx.TransportError as e:
+            if attempt + 1 >= max_retries or not (idempotent or isinstance(e, _UNSENT_ERRORS)):
+                raise
+            delay = None
+            reason = type(e).__name__
+
+        if delay is None:
+            delay = min(cap, base * 2 ** attempt) * (1 + random.random() * jitter)
+        delay = min(cap, delay)
+
+        logger.warning(f"Retrying after {reason} in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+        await asyncio.sleep(delay)
+
+    raise ValueError("max_retries must be at least 1")
@@ -2,16 +2,76 @@
 Enhanced AI Service with Voice & Image Processing
 Handles AI interactions, voice transcription, and image OCR
 """
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import re
 import logging
 import base64
+import asyncio
 from pathlib import Path
 
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# In-flight chat completions keyed by (phone, message hash).
+# A double-tapped send awaits the first call instead of paying OpenAI twice.
+_inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+
+# Rate-limit retries for batch (non-interactive) completions
+BATCH_MAX_RETRIES = 5
+
+# Intents whose reply is predictable enough to render locally without OpenAI,
+# keyed by intent then language (user's preferred_language)
+FAST_PATH_TEMPLATES = {
+    "check_balance": {
+        "en": "💰 Your wallet balance is R{balance:.2f}.",
+        "af": "💰 Jou beursie se saldo is R{balance:.2f}.",
+        "zu": "💰 Ibhalansi yesikhwama sakho ingu-R{balance:.2f}.",
+        "xh": "💰 Ibhalansi yesipaji sakho ngu-R{balance:.2f}.",
+    },
+    "help": {
+        "en": "Here's what I can help you with 👇",
+        "af": "Hier is waarmee ek jou kan help 👇",
+        "zu": "Nakhu engingakusiza ngakho 👇",
+        "xh": "Nantsi into endinokukunceda ngayo 👇",
+    },
+    "greeting": {
+        "en": "Hi {name}! 👋 How can I help you today?",
+        "af": "Hallo {name}! 👋 Hoe kan ek jou vandag help?",
+        "zu": "Sawubona {name}! 👋 Ngingakusiza ngani namuhla?",
+        "xh": "Molo {name}! 👋 Ndingakunceda ngantoni namhlanje?",
+    },
+}
+# Whole messages (lowercased, punctuation dropped) answered from the templates.
+# Exact commands only: keyword matching would send "what's this" (contains "hi")
+# or "send money to mom" (contains "money") a canned reply
+FAST_PATH_COMMANDS = {
+    "balance": "check_balance",
+    "my balance": "check_balance",
+    "check balance": "check_balance",
+    "check my balance": "check_balance",
+    "wallet": "check_balance",
+    "wallet balance": "check_balance",
+    "saldo": "check_balance",
+    "help": "help",
+    "help me": "help",
+    "menu": "help",
+    "hi": "greeting",
+    "hello": "greeting",
+    "hey": "greeting",
+    "hi there": "greeting",
+    "hello there": "greeting",
+    "hey there": "greeting",
+    "start": "greeting",
+    "good morning": "greeting",
+    "good afternoon": "greeting",
+    "good evening": "greeting",
+    "hallo": "greeting",
+    "sawubona": "greeting",
+    "molo": "greeting",
+}
+_NON_WORD = re.compile(r"[^\w\s]")
+
 
 class AIService:
     """
@@ -59,11 +119,106 @@ Respond naturally and conversationally. Keep messages concise for WhatsApp."""
     ) -> Dict:
         """
         Process a user message and return intent, entities, and response.
+        Identical concurrent requests from the same user share one AI call.
+        """
+        fast_result = await AIService._fast_path(message, user_context)
+        if fast_result:
+            return fast_result
+        
+        key = (user_context.get('phone', 'unknown'), hash(message))
+        
+        pending = _inflight.get(key)
+        if pending is not None:
+            logger.info(f"Duplicate in-flight message from {key[0]}, awaiting first request")
+            # Shield so a cancelled duplicate doesn't cancel the shared call
+            return await asyncio.shield(pending)
+        
+        # No await between the lookup above and this insert, so no lock is needed
+        future = asyncio.get_running_loop().create_future()
+        _inflight[key] = future
+        try:
+            result = await AIService._complete_message(message, user_context, conversation_history)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            # Waiters get the real error; mark it retrieved so asyncio doesn't
+            # log "exception never retrieved" when nobody was waiting
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            # Only reached undone if the leader itself was cancelled
+            if not future.done():
+                future.cancel()
+            _inflight.pop(key, None)
+    
+    @staticmethod
+    async def _fast_path(message: str, user_context: Dict) -> Optional[Dict]:
+        """
+        Answer high-frequency, predictable intents from templates.
+        Returns None when the message needs the model.
+        """
+        command = " ".join(_NON_WORD.sub("", message.lower()).split())
+        intent = FAST_PATH_COMMANDS.get(command)
+        if intent is None:
+            return None
+        
+        templates = FAST_PATH_TEMPLATES[intent]
+        template = templates.get(user_context.get('language') or "en", templates["en"])
+        response = template.format(
+            name=user_context.get('name', 'there'),
+            balance=user_context.get('balance', 0)
+        )
+        
+        return {
+            "intent": intent,
+            "entities": {},
+            "response": response,
+            "confidence": 0.95,
+            "requires_confirmation": False,
+            "next_action": None
+        }
+    
+    @staticmethod
+    async def process_messages_batch(
+        items: List[Dict],
+        concurrency: int = 50
+    ) -> List:
+        """
+        Process many messages concurrently for non-interactive flows
+        (notifications, summaries, broadcast personalisation).
+        
+        Args:
+            items: process_message kwargs, one dict per message
+            concurrency: Maximum OpenAI requests in flight
+        
+        Returns:
+            Results aligned with items; a failed item holds its exception
+        """
+        sem = asyncio.Semaphore(concurrency)
+        
+        async def run(item: Dict) -> Dict:
+            async with sem:
+                # The OpenAI client backs off exponentially on 429s (honouring
+                # Retry-After); batches can afford to wait longer than chat turns
+                return await AIService._complete_message(**item, max_retries=BATCH_MAX_RETRIES)
+        
+        return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+    
+    @staticmethod
+    async def _complete_message(
+        message: str,
+        user_context: Dict,
+        conversation_history: List[Dict] = None,
+        max_retries: int = 2
+    ) -> Dict:
+        """
+        Run the chat completion and intent analysis for a single message.
         """
         try:
             from openai import AsyncOpenAI
             
-            client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+            client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=max_retries)
             
             # Build conversation context
             messages = [
@@ -225,7 +380,7 @@ Respond naturally and conversationally. Keep messages concise for WhatsApp."""
     
     @staticmethod
     def _extract_amount(text: str) -> Optional[float]:
-        """Extract monetary amount from text."""
+        """Extract monetary amount from (lowercased) text."""
         # Match patterns like: R50, R 50, 50, 50.00, 10 rand
         patterns = [
             r'r\s*(\d+(?:\.\d{2})?)',  # R50 or R 50
@@ -234,7 +389,7 @@ Respond naturally and conversationally. Keep messages concise for WhatsApp."""
         ]
         
         for pattern in patterns:
-            match = re.search(pattern, text.lower())
+            match = re.search(pattern, text)
             if match:
                 try:
                     return float(match.group(1))
@@ -261,16 +416,14 @@ Respond naturally and conversationally. Keep messages concise for WhatsApp."""
     
     @staticmethod
     def _extract_network(text: str) -> Optional[str]:
-        """Extract mobile network from text."""
-        text_lower = text.lower()
-        
-        if 'mtn' in text_lower:
+        """Extract mobile network from (lowercased) text."""
+        if 'mtn' in text:
             return 'MTN'
-        elif 'vodacom' in text_lower or 'vodac' in text_lower:
+        elif 'vodacom' in text or 'vodac' in text:
             return 'Vodacom'
-        elif 'cell c' in text_lower or 'cellc' in text_lower:
+        elif 'cell c' in text or 'cellc' in text:
             return 'Cell C'
-        elif 'telkom' in text_lower:
+        elif 'telkom' in text:
             return 'Telkom'
         
         # Try to detect from phone number prefix
@@ -1,17 +1,136 @@
 """
 Beneficiary Service - Manage saved contacts and utility accounts
 """
-from typing import List, Tuple, Optional
+from types import MappingProxyType
+from typing import ClassVar, Dict, List, Mapping, Tuple, Optional
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+import json
+import uuid
+import pygtrie
+import ahocorasick
+from cachetools import TTLCache
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import redis
+import redis.asyncio as aioredis
 from app.models.beneficiary import Beneficiary, BeneficiaryType
+from app.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Beneficiaries change rarely but are read on every transactional message,
+# so lookups are cached in Redis and invalidated on save/delete
+CACHE_TTL_SECONDS = 300
+
+# The cache is optional: an unreachable Redis must fail fast, not stall requests
+REDIS_TIMEOUT_SECONDS = 0.5
+
+
+@lru_cache(maxsize=1)
+def _redis_sync() -> redis.Redis:
+    return redis.Redis.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        socket_timeout=REDIS_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_TIMEOUT_SECONDS
+    )
+
+
+@lru_cache(maxsize=1)
+def _redis() -> aioredis.Redis:
+    return aioredis.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        socket_timeout=REDIS_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_TIMEOUT_SECONDS
+    )
+
+# Per-user nickname tries for prefix lookups ("mo" -> "Mom"), built on first use;
+# bounded and expiring like the automata below
+_nickname_tries: TTLCache = TTLCache(maxsize=10_000, ttl=600)
+
+# Per-user Aho-Corasick automata over nicknames, for spotting a saved beneficiary
+# anywhere in a message (None = user has none); expire so other workers' edits show up
+_nickname_automata: TTLCache = TTLCache(maxsize=10_000, ttl=600)
+
+
+def _nickname_key(user_id: str, nickname: str) -> str:
+    return f"bene:{user_id}:{nickname.lower()}"
+
+
+def _list_key(user_id: str) -> str:
+    return f"bene:list:{user_id}"
+
+
+def _to_cache(beneficiary: Beneficiary) -> Dict:
+    """Serialize a beneficiary for the cache"""
+    return {
+        "id": str(beneficiary.id),
+        "user_id": str(beneficiary.user_id),
+        "nickname": beneficiary.nickname,
+        "beneficiary_type": beneficiary.beneficiary_type.value,
+        "value": beneficiary.value,
+        "network": beneficiary.network,
+        "created_at": beneficiary.created_at.isoformat() if beneficiary.created_at else None,
+    }
+
+
+def _from_cache(data: Dict) -> Beneficiary:
+    """Rebuild a (detached) beneficiary from its cached form"""
+    return Beneficiary(
+        id=uuid.UUID(data["id"]),
+        user_id=uuid.UUID(data["user_id"]),
+        nickname=data["nickname"],
+        beneficiary_type=BeneficiaryType(data["beneficiary_type"]),
+        value=data["value"],
+        network=data["network"],
+        created_at=datetime.fromisoformat(data["created_at"]) if data["created_at"] else None,
+    )
+
 
 class BeneficiaryService:
     """Service for managing user beneficiaries"""
     
+    # Emoji shown next to each beneficiary type (read-only)
+    _TYPE_ICONS: ClassVar[Mapping[BeneficiaryType, str]] = MappingProxyType({
+        BeneficiaryType.PHONE: "📱",
+        BeneficiaryType.METER: "⚡",
+        BeneficiaryType.WATER: "💧",
+        BeneficiaryType.INTERNET: "🌐",
+        BeneficiaryType.TV: "📺",
+        BeneficiaryType.MUNICIPAL: "🏛️",
+        BeneficiaryType.OTHER: "💳"
+    })
+    
+    @staticmethod
+    def _insert_stmt(
+        user_id: str,
+        nickname: str,
+        value: str,
+        beneficiary_type: BeneficiaryType,
+        network: Optional[str]
+    ):
+        """
+        Build the single round-trip insert for a beneficiary.
+        The unique (user_id, lower(nickname)) index turns a duplicate
+        nickname into a no-op, so no row is returned in that case.
+        """
+        return insert(Beneficiary).values(
+            user_id=user_id,
+            nickname=nickname,
+            value=value,
+            beneficiary_type=beneficiary_type,
+            network=network
+        ).on_conflict_do_nothing(
+            index_elements=[Beneficiary.user_id, func.lower(Beneficiary.nickname)]
+        ).returning(Beneficiary)
+    
     def save_beneficiary(
         self,
         user_id: str,
@@ -28,30 +147,18 @@ class BeneficiaryService:
             (success, message, beneficiary)
         """
         try:
-            # Check if nickname already exists
-            existing = db.query(Beneficiary).filter(
-                Beneficiary.user_id == user_id,
-                Beneficiary.nickname.ilike(nickname)
-            ).first()
+            stmt = self._insert_stmt(user_id, nickname, value, beneficiary_type, network)
+            beneficiary = db.scalars(stmt).first()
             
-            if existing:
+            if beneficiary is None:
+                db.rollback()
                 return False, f"❌ '{nickname}' already exists. Use a different name or delete the old one first.", None
             
-            # Create beneficiary
-            beneficiary = Beneficiary(
-                user_id=user_id,
-                nickname=nickname,
-                value=value,
-                beneficiary_type=beneficiary_type,
-                network=network
-            )
-            
-            db.add(beneficiary)
             db.commit()
-            db.refresh(beneficiary)
+            self._invalidate(user_id, nickname)
             
             # Format success message based on type
-            icon = self._get_type_icon(beneficiary_type)
+            icon = self._TYPE_ICONS.get(beneficiary_type, "💳")
             return True, f"✅ Saved '{nickname}' {icon}\n{value}", beneficiary
             
         except Exception as e:
@@ -66,12 +173,33 @@ class BeneficiaryService:
         db: Session
     ) -> List[Beneficiary]:
         """Get all beneficiaries for a user, optionally filtered by type"""
+        # Only the unfiltered list (the per-message hot path) is cached
+        if beneficiary_type is None:
+            try:
+                cached = _redis_sync().get(_list_key(user_id))
+                if cached:
+                    return [_from_cache(d) for d in json.loads(cached)]
+            except redis.RedisError as e:
+                logger.warning(f"Beneficiary cache read failed: {str(e)}")
+        
         query = db.query(Beneficiary).filter(Beneficiary.user_id == user_id)
         
         if beneficiary_type:
             query = query.filter(Beneficiary.beneficiary_type == beneficiary_type)
         
-        return query.order_by(Beneficiary.created_at.desc()).all()
+        beneficiaries = query.order_by(Beneficiary.created_at.desc()).all()
+        
+        if beneficiary_type is None:
+            try:
+                _redis_sync().setex(
+                    _list_key(user_id),
+                    CACHE_TTL_SECONDS,
+                    json.dumps([_to_cache(b) for b in beneficiaries])
+                )
+            except redis.RedisError as e:
+                logger.warning(f"Beneficiary cache write failed: {str(e)}")
+        
+        return beneficiaries
     
     def find_beneficiary(
         self,
@@ -80,10 +208,95 @@ class BeneficiaryService:
         db: Session
     ) -> Optional[Beneficiary]:
         """Find a beneficiary by nickname (case-insensitive)"""
-        return db.query(Beneficiary).filter(
+        key = _nickname_key(user_id, nickname)
+        try:
+            cached = _redis_sync().get(key)
+            if cached:
+                return _from_cache(json.loads(cached))
+        except redis.RedisError as e:
+            logger.warning(f"Beneficiary cache read failed: {str(e)}")
+        
+        # lower() equality (not ilike) so the (user_id, lower(nickname)) index is used
+        beneficiary = db.query(Beneficiary).filter(
             Beneficiary.user_id == user_id,
-            Beneficiary.nickname.ilike(nickname)
+            func.lower(Beneficiary.nickname) == nickname.lower()
         ).first()
+        
+        if beneficiary:
+            try:
+                _redis_sync().setex(key, CACHE_TTL_SECONDS, json.dumps(_to_cache(beneficiary)))
+            except redis.RedisError as e:
+                logger.warning(f"Beneficiary cache write failed: {str(e)}")
+        
+        return beneficiary
+    
+    def find_beneficiary_by_prefix(
+        self,
+        user_id: str,
+        prefix: str,
+        db: Session,
+        limit: int = 5
+    ) -> List[str]:
+        """Find saved nicknames starting with prefix (case-insensitive)"""
+        user_key = str(user_id)
+        trie = _nickname_tries.get(user_key)
+        
+        if trie is None:
+            trie = pygtrie.CharTrie()
+            rows = db.query(Beneficiary.nickname).filter(Beneficiary.user_id == user_id).all()
+            for (nickname,) in rows:
+                trie[nickname.lower()] = nickname
+            _nickname_tries[user_key] = trie
+        
+        try:
+            return list(islice(trie.itervalues(prefix=prefix.lower()), limit))
+        except KeyError:
+            # No nickname has this prefix
+            return []
+    
+    def find_mentioned_beneficiary(
+        self,
+        user_id: str,
+        text: str,
+        db: Session,
+        cached_only: bool = False
+    ) -> Optional[Beneficiary]:
+        """
+        Find the saved beneficiary whose nickname appears in (lowercased) text.
+        With cached_only, a user whose automaton isn't cached yet gets None
+        instead of a SELECT to build it.
+        """
+        user_key = str(user_id)
+        automaton = _nickname_automata.get(user_key, False)
+        
+        if automaton is False:
+            if cached_only:
+                return None
+            automaton = None
+            # Straight from the DB, not get_beneficiaries: this runs in the sync
+            # classifier on the event loop, so no Redis round trip here
+            rows = db.query(Beneficiary.id, Beneficiary.nickname).filter(
+                Beneficiary.user_id == user_id
+            ).order_by(Beneficiary.created_at.desc()).all()
+            # Plain (rank, id) payloads: the cache outlives this session, so it
+            # must not hold ORM instances (they'd come back detached/expired)
+            for rank, (beneficiary_id, nickname) in enumerate(rows):
+                if automaton is None:
+                    automaton = ahocorasick.Automaton()
+                automaton.add_word(nickname.lower(), (rank, beneficiary_id))
+            if automaton is not None:
+                automaton.make_automaton()
+            _nickname_automata[user_key] = automaton
+        
+        if automaton is None:
+            return None
+        
+        # Several nicknames may match; keep list order (first saved wins)
+        best = min((hit for _, hit in automaton.iter(text)), default=None, key=itemgetter(0))
+        if best is None:
+            return None
+        # Load into the caller's session (identity-map hit if already there)
+        return db.get(Beneficiary, best[1])
     
     def delete_beneficiary(
         self,
@@ -98,8 +311,10 @@ class BeneficiaryService:
             if not beneficiary:
                 return False, f"❌ '{nickname}' not found in your beneficiaries."
             
-            db.delete(beneficiary)
+            # The lookup may come from cache (detached), so delete by primary key
+            db.query(Beneficiary).filter(Beneficiary.id == beneficiary.id).delete()
             db.commit()
+            self._invalidate(user_id, nickname)
             
             return True, f"✅ Deleted '{nickname}'"
             
@@ -108,35 +323,168 @@ class BeneficiaryService:
             db.rollback()
             return False, "❌ Failed to delete beneficiary. Please try again."
     
+    @staticmethod
+    def _invalidate(user_id: str, nickname: str) -> None:
+        """Drop cached lookups for a user after a mutation"""
+        _nickname_tries.pop(str(user_id), None)
+        _nickname_automata.pop(str(user_id), None)
+        try:
+            _redis_sync().delete(_nickname_key(user_id, nickname), _list_key(user_id))
+        except redis.RedisError as e:
+            logger.warning(f"Beneficiary cache invalidation failed: {str(e)}")
+    
+    @staticmethod
+    async def _invalidate_async(user_id: str, nickname: str) -> None:
+        """Drop cached lookups for a user after a mutation"""
+        _nickname_tries.pop(str(user_id), None)
+        _nickname_automata.pop(str(user_id), None)
+        try:
+            await _redis().delete(_nickname_key(user_id, nickname), _list_key(user_id))
+        except redis.RedisError as e:
+            logger.warning(f"Beneficiary cache invalidation failed: {str(e)}")
+    
+    # Async variants for callers holding an AsyncSession, so DB I/O
+    # doesn't block the event loop
+    
+    async def save_beneficiary_async(
+        self,
+        user_id: str,
+        nickname: str,
+        value: str,
+        beneficiary_type: BeneficiaryType,
+        network: Optional[str],
+        db: AsyncSession
+    ) -> Tuple[bool, str, Optional[Beneficiary]]:
+        """
+        Save a new beneficiary.
+        
+        Returns:
+            (success, message, beneficiary)
+        """
+        try:
+            stmt = self._insert_stmt(user_id, nickname, value, beneficiary_type, network)
+            beneficiary = (await db.scalars(stmt)).first()
+            
+            if beneficiary is None:
+                await db.rollback()
+                return False, f"❌ '{nickname}' already exists. Use a different name or delete the old one first.", None
+            
+            await db.commit()
+            await self._invalidate_async(user_id, nickname)
+            
+            icon = self._TYPE_ICONS.get(beneficiary_type, "💳")
+            return True, f"✅ Saved '{nickname}' {icon}\n{value}", beneficiary
+            
+        except Exception as e:
+            logger.error(f"Error saving beneficiary: {str(e)}")
+            await db.rollback()
+            return False, "❌ Failed to save beneficiary. Please try again.", None
+    
+    async def get_beneficiaries_async(
+        self,
+        user_id: str,
+        beneficiary_type: Optional[BeneficiaryType],
+        db: AsyncSession
+    ) -> List[Beneficiary]:
+        """Get all beneficiaries for a user, optionally filtered by type"""
+        if beneficiary_type is None:
+            try:
+                cached = await _redis().get(_list_key(user_id))
+                if cached:
+                    return [_from_cache(d) for d in json.loads(cached)]
+            except redis.RedisError as e:
+                logger.warning(f"Beneficiary cache read failed: {str(e)}")
+        
+        stmt = select(Beneficiary).where(Beneficiary.user_id == user_id)
+        
+        if beneficiary_type:
+            stmt = stmt.where(Beneficiary.beneficiary_type == beneficiary_type)
+        
+        result = await db.scalars(stmt.order_by(Beneficiary.created_at.desc()))
+        beneficiaries = list(result.all())
+        
+        if beneficiary_type is None:
+            try:
+                await _redis().setex(
+                    _list_key(user_id),
+                    CACHE_TTL_SECONDS,
+                    json.dumps([_to_cache(b) for b in beneficiaries])
+                )
+            except redis.RedisError as e:
+                logger.warning(f"Beneficiary cache write failed: {str(e)}")
+        
+        return beneficiaries
+    
+    async def find_beneficiary_async(
+        self,
+        user_id: str,
+        nickname: str,
+        db: AsyncSession
+    ) -> Optional[Beneficiary]:
+        """Find a beneficiary by nickname (case-insensitive)"""
+        key = _nickname_key(user_id, nickname)
+        try:
+            cached = await _redis().get(key)
+            if cached:
+                return _from_cache(json.loads(cached))
+        except redis.RedisError as e:
+            logger.warning(f"Beneficiary cache read failed: {str(e)}")
+        
+        stmt = select(Beneficiary).where(
+            Beneficiary.user_id == user_id,
+            func.lower(Beneficiary.nickname) == nickname.lower()
+        )
+        result = await db.execute(stmt)
+        beneficiary = result.scalars().first()
+        
+        if beneficiary:
+            try:
+                await _redis().setex(key, CACHE_TTL_SECONDS, json.dumps(_to_cache(beneficiary)))
+            except redis.RedisError as e:
+                logger.warning(f"Beneficiary cache write failed: {str(e)}")
+        
+        return beneficiary
+    
+    async def delete_beneficiary_async(
+        self,
+        user_id: str,
+        nickname: str,
+        db: AsyncSession
+    ) -> Tuple[bool, str]:
+        """Delete a beneficiary by nickname"""
+        try:
+            beneficiary = await self.find_beneficiary_async(user_id, nickname, db)
+            
+            if not beneficiary:
+                return False, f"❌ '{nickname}' not found in your beneficiaries."
+            
+            # The lookup may come from cache (detached), so delete by primary key
+            await db.execute(delete(Beneficiary).where(Beneficiary.id == beneficiary.id))
+            await db.commit()
+            await self._invalidate_async(user_id, nickname)
+            
+            return True, f"✅ Deleted '{nickname}'"
+            
+        except Exception as e:
+            logger.error(f"Error deleting beneficiary: {str(e)}")
+            await db.rollback()
+            return False, "❌ Failed to delete beneficiary. Please try again."
+    
     def format_beneficiary_list(self, beneficiaries: List[Beneficiary]) -> str:
         """Format beneficiaries for display"""
         if not beneficiaries:
             return "📋 No saved beneficiaries yet.\n\nSave one with:\nsave [name] [number]"
         
-        message = "💾 *Your Beneficiaries:*\n\n"
+        parts = ["💾 *Your Beneficiaries:*\n\n"]
         
         for b in beneficiaries:
-            icon = self._get_type_icon(b.beneficiary_type)
-            message += f"{icon} *{b.nickname}*\n"
-            message += f"   {b.value}\n"
+            icon = self._TYPE_ICONS.get(b.beneficiary_type, "💳")
+            parts.append(f"{icon} *{b.nickname}*\n   {b.value}\n")
             if b.network:
-                message += f"   Network: {b.network}\n"
-            message += "\n"
-        
-        return message.strip()
-    
-    def _get_type_icon(self, beneficiary_type: BeneficiaryType) -> str:
-        """Get emoji icon for beneficiary type"""
-        icons = {
-            BeneficiaryType.PHONE: "📱",
-            BeneficiaryType.METER: "⚡",
-            BeneficiaryType.WATER: "💧",
-            BeneficiaryType.INTERNET: "🌐",
-            BeneficiaryType.TV: "📺",
-            BeneficiaryType.MUNICIPAL: "🏛️",
-            BeneficiaryType.OTHER: "💳"
-        }
-        return icons.get(beneficiary_type, "💳")
+                parts.append(f"   Network: {b.network}\n")
+            parts.append("\n")
+        
+        return "".join(parts).strip()
 
 
 # Singleton instance
@@ -2,271 +2,375 @@
 Intent Classifier - Rule-Based (No AI Guessing)
 Deterministic intent detection to prevent hallucinations
 """
-from typing import Dict, Optional
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
 from sqlalchemy.orm import Session
 import re
 import logging
-from difflib import SequenceMatcher
+from functools import lru_cache
+from rapidfuzz import fuzz, process
+import ahocorasick
 
 logger = logging.getLogger(__name__)
 
+_NO_ENTITIES: Mapping[str, Any] = MappingProxyType({})
 
-def fuzzy_match(text: str, target: str, threshold: float = 0.75) -> bool:
-    """Check if text fuzzy matches target (handles typos)"""
-    ratio = SequenceMatcher(None, text.lower(), target.lower()).ratio()
+
+@dataclass(slots=True, frozen=True)
+class IntentResult:
+    """Structured intent with handler function name (immutable, safe to share)"""
+    intent: str
+    handler: Optional[str]
+    use_ai: bool
+    confidence: float
+    entities: Mapping[str, Any] = field(default_factory=lambda: _NO_ENTITIES)
+    suggested_intent: Optional[str] = None  # set if typo detected
+    original_message: Optional[str] = None
+
+# Entity patterns, compiled once at import (every inbound message runs these).
+# Each is one alternation scanned in a single pass; earlier alternatives take
+# priority over later ones wherever they occur in the text.
+_AMOUNT_RE = re.compile(
+    r'r\s*(?P<r_prefix>\d+(?:\.\d{2})?)'  # R50 or R 50
+    r'|(?P<rand_suffix>\d+(?:\.\d{2})?)\s*rand'  # 50 rand
+    r'|\b(?=(?P<bare>\d+(?:\.\d{2})?)\b)'  # Just numbers (zero-width)
+)
+_AMOUNT_PRIORITY = {"r_prefix": 0, "rand_suffix": 1, "bare": 2}
+_PHONE_RE = re.compile(
+    r'(?P<intl>\+27\d{9})'  # +27821234567
+    r'|(?P<local>0\d{9})'  # 0821234567
+)
+_METER_RE = re.compile(r'\b(\d{11})\b')
+_NETWORK_RE = re.compile(r'\b(mtn|vodacom|voda|cell[- ]?c|telkom)\b', re.IGNORECASE)
+_NETWORK_NAMES = {
+    "mtn": "mtn",
+    "vodacom": "vodacom",
+    "voda": "vodacom",
+    "cell c": "cell c",
+    "cellc": "cell c",
+    "cell-c": "cell c",
+    "telkom": "telkom",
+}
+
+# Common command typos: canonical command -> variations to fuzzy match against
+TYPO_SUGGESTIONS = {
+    "show beneficiaries": ["show beneficiar", "beneficiries", "beneficireis", "beneficiries"],
+    "buy airtime": ["buy airtime", "airtime", "buy air time"],
+    "buy data": ["buy data", "data bundle"],
+    "check balance": ["balance", "my balance", "wallet"],
+}
+
+# Flattened once so typo detection is a single extractOne call
+_TYPO_CANONICAL = {
+    variation.lower(): command
+    for command, variations in TYPO_SUGGESTIONS.items()
+    for variation in variations
+}
+_TYPO_VARIATIONS = list(_TYPO_CANONICAL)
+TYPO_SCORE_CUTOFF = 65
+
+# fuzz.ratio is 200*matches/(len(a)+len(b)), so a variation can only reach the
+# cutoff when 200*min(len) >= cutoff*(len sum). Precompute, per message length,
+# the variations that pass that bound (original order kept for tie-breaking);
+# longer messages have no candidates and skip fuzzy matching entirely.
+_TYPO_MAX_MSG_LEN = max(map(len, _TYPO_VARIATIONS)) * (200 - TYPO_SCORE_CUTOFF) // TYPO_SCORE_CUTOFF
+_TYPO_CANDIDATES_BY_LEN = [
+    [v for v in _TYPO_VARIATIONS if 200 * min(n, len(v)) >= TYPO_SCORE_CUTOFF * (n + len(v))]
+    for n in range(_TYPO_MAX_MSG_LEN + 1)
+]
+
+# Intent-category bits, in precedence order (lowest set bit wins)
+BIT_SAVE = 1 << 0
+BIT_SHOW = 1 << 1
+BIT_DELETE = 1 << 2
+BIT_BALANCE = 1 << 3
+BIT_ACCOUNT = 1 << 4
+BIT_TRANSACTION = 1 << 5
+BIT_AIRTIME = 1 << 6
+BIT_DATA = 1 << 7
+BIT_ELECTRICITY = 1 << 8
+BIT_GREETING = 1 << 9
+BIT_HELP = 1 << 10
+
+_BIT_INTENTS = {
+    BIT_SAVE: "save_beneficiary",
+    BIT_SHOW: "show_beneficiaries",
+    BIT_DELETE: "delete_beneficiary",
+    BIT_BALANCE: "check_balance",
+    BIT_ACCOUNT: "account_details",
+    BIT_TRANSACTION: "beneficiary_transaction",
+    BIT_AIRTIME: "buy_airtime",
+    BIT_DATA: "buy_data",
+    BIT_ELECTRICITY: "buy_electricity",
+    BIT_GREETING: "greeting",
+    BIT_HELP: "help",
+}
+
+# Keyword bits for the rule-based patterns (substring matches, as before)
+KEYWORD_GROUPS = {
+    BIT_SAVE: ["save beneficiar"],
+    BIT_SHOW: ["show beneficiar", "list beneficiar", "my beneficiar", "saved contacts"],
+    BIT_BALANCE: ["balance", "wallet", "how much money"],
+    BIT_ACCOUNT: ["account details", "my details", "my account", "account info", "show my info"],
+    BIT_TRANSACTION: ["recharge", "buy", "pay", "send"],
+    BIT_AIRTIME: ["airtime", "recharge", "topup", "top up"],
+    BIT_DATA: ["data", "bundle", "gigs", "gb", "mb"],
+    BIT_ELECTRICITY: ["electricity", "power", "token", "eskom", "meter"],
+    BIT_GREETING: ["hi", "hello", "hey", "start", "menu"],
+    BIT_HELP: ["help", "what can", "commands", "options"],
+}
+
+
+def _build_keyword_automaton() -> ahocorasick.Automaton:
+    """Build one Aho-Corasick automaton over every keyword, valued by its bits"""
+    keyword_bits: Dict[str, int] = {}
+    for bit, keywords in KEYWORD_GROUPS.items():
+        for keyword in keywords:
+            keyword_bits[keyword] = keyword_bits.get(keyword, 0) | bit
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, bits in keyword_bits.items():
+        automaton.add_word(keyword, bits)
+    automaton.make_automaton()
+    return automaton
+
+
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+# Command keywords plus question/filler words. A transaction message made only
+# of these, with no amount or number ("how do i buy", "buy electricity"),
+# doesn't warrant the SELECT that builds a user's nickname index
+_NON_NICKNAME_WORDS = frozenset(
+    word
+    for keywords in KEYWORD_GROUPS.values()
+    for keyword in keywords
+    for word in keyword.split()
+) | frozenset({
+    "a", "an", "the", "i", "me", "my", "you", "your", "we", "our", "it", "this", "that",
+    "how", "what", "where", "when", "why", "who", "can", "could", "do", "does", "did",
+    "is", "are", "am", "be", "will", "would", "should", "want", "need", "like", "please",
+    "to", "for", "of", "on", "in", "with", "and", "or", "some", "more", "much", "money",
+    "get", "up", "now", "today", "again", "just", "ok", "okay",
+})
+_WORD_RE = re.compile(r"[a-z]+")
+
+# Every mask resolves to the intent of its highest-precedence bit
+_DISPATCH = {0: "unclear"}
+_DISPATCH.update(
+    (mask, _BIT_INTENTS[mask & -mask]) for mask in range(1, BIT_HELP << 1)
+)
+
+# Intents that carry no entities share one result instance each
+_STATIC_RESULTS = {
+    result.intent: result
+    for result in (
+        IntentResult("save_beneficiary", "handle_save_beneficiary", False, 0.95),
+        IntentResult("show_beneficiaries", "handle_show_beneficiaries", False, 0.95),
+        IntentResult("delete_beneficiary", "handle_delete_beneficiary", False, 0.9),
+        IntentResult("check_balance", "handle_check_balance", False, 0.95),
+        IntentResult("account_details", "handle_account_details", False, 0.95),
+        IntentResult("greeting", None, True, 0.9),  # AI gives friendly greeting
+        IntentResult("help", "send_menu", False, 0.95),
+        IntentResult("unclear", None, True, 0.5),
+    )
+}
+
+
+def match_keyword_mask(msg: str) -> int:
+    """Return the OR of every keyword bit present in msg, in a single pass"""
+    mask = 0
+    for _, bits in _KEYWORD_AUTOMATON.iter(msg):
+        mask |= bits
+    return mask
+
+
+def fuzzy_match_lower(text_lower: str, target_lower: str, threshold: float = 0.75) -> bool:
+    """Check if already-lowercased text fuzzy matches target (handles typos)"""
+    ratio = fuzz.ratio(text_lower, target_lower) / 100.0
     return ratio >= threshold
 
 
-def classify_intent(message: str, user_id: str, db: Session) -> Dict:
+def classify_intent(message: str, user_id: str, db: Session) -> IntentResult:
     """
     Rule-based intent classification.
     Returns structured intent with handler function name.
-    
-    Returns:
-        {
-            "intent": str,
-            "entities": dict,
-            "handler": str | None,
-            "use_ai": bool,
-            "confidence": float,
-            "suggested_intent": str (if typo detected)
-        }
     """
     msg = message.lower().strip()
     
-    # Check for typos in common commands
-    typo_suggestions = {
-        "show beneficiaries": ["show beneficiar", "beneficiries", "beneficireis", "beneficiries"],
-        "buy airtime": ["buy airtime", "airtime", "buy air time"],
-        "buy data": ["buy data", "data bundle"],
-        "check balance": ["balance", "my balance", "wallet"],
-    }
-    
-    for correct_command, variations in typo_suggestions.items():
-        for variation in variations:
-            if fuzzy_match(msg, variation, 0.65):
-                # Found potential typo - return with suggestion
-                return {
-                    "intent": "typo_detected",
-                    "entities": {},
-                    "handler": "handle_typo_confirmation",
-                    "use_ai": False,
-                    "confidence": 0.8,
-                    "suggested_intent": correct_command,
-                    "original_message": message
-                }
+    result = _classify_static(msg)
     
-    # Pattern 1: Save beneficiary
-    if msg.startswith("save ") or "save beneficiary" in msg or "save beneficiar" in msg:
-        return {
-            "intent": "save_beneficiary",
-            "entities": {},
-            "handler": "handle_save_beneficiary",
-            "use_ai": False,
-            "confidence": 0.95
-        }
-    
-    # Pattern 2: Show/list beneficiaries (with typo tolerance)
-    show_keywords = ["show beneficiar", "list beneficiar", "my beneficiar", "saved contacts"]
-    if any(keyword in msg for keyword in show_keywords) or fuzzy_match(msg, "show beneficiaries", 0.7):
-        return {
-            "intent": "show_beneficiaries",
-            "entities": {},
-            "handler": "handle_show_beneficiaries",
-            "use_ai": False,
-            "confidence": 0.95
-        }
-    
-    # Pattern 3: Delete beneficiary
-    if msg.startswith("delete ") or msg.startswith("remove "):
-        return {
-            "intent": "delete_beneficiary",
-            "entities": {},
-            "handler": "handle_delete_beneficiary",
-            "use_ai": False,
-            "confidence": 0.9
-        }
-    
-    # Pattern 4: Check balance
-    if any(word in msg for word in ["balance", "wallet", "how much money"]):
-        return {
-            "intent": "check_balance",
-            "entities": {},
-            "handler": "handle_check_balance",
-            "use_ai": False,
-            "confidence": 0.95
-        }
-    
-    # Pattern 5: Account details
-    if any(phrase in msg for phrase in ["account details", "my details", "my account", "account info", "show my info"]):
-        return {
-            "intent": "account_details",
-            "entities": {},
-            "handler": "handle_account_details",
-            "use_ai": False,
-            "confidence": 0.95
-        }
-    
-    # Pattern 6: Transaction with beneficiary reference
-    # "recharge mom", "buy airtime for thabo", "electricity for home"
-    if any(word in msg for word in ["recharge", "buy", "pay", "send"]):
-        # Check if any saved beneficiary is mentioned
+    if result is None:
+        # Transaction with beneficiary reference
+        # "recharge mom", "buy airtime for thabo", "electricity for home"
         from app.services.beneficiary_service import beneficiary_service
         
-        beneficiaries = beneficiary_service.get_beneficiaries(user_id, None, db)
-        mentioned_beneficiary = None
-        
-        for beneficiary in beneficiaries:
-            if beneficiary.nickname.lower() in msg:
-                mentioned_beneficiary = beneficiary
-                break
+        # Saved nicknames come first - they may be filler words too ("me",
+        # "home") - but only a message with an entity signal builds the index
+        mentioned_beneficiary = beneficiary_service.find_mentioned_beneficiary(
+            user_id, msg, db, cached_only=not _has_transaction_signal(msg)
+        )
         
         if mentioned_beneficiary:
             # Extract amount
             amount = extract_amount(msg)
             
-            return {
-                "intent": "beneficiary_transaction",
-                "entities": {
+            return IntentResult(
+                intent="beneficiary_transaction",
+                handler="handle_beneficiary_transaction",
+                use_ai=False if amount else True,  # Use AI only if amount missing
+                confidence=0.9,
+                entities=MappingProxyType({
                     "beneficiary": mentioned_beneficiary,
                     "amount": amount
-                },
-                "handler": "handle_beneficiary_transaction",
-                "use_ai": False if amount else True,  # Use AI only if amount missing
-                "confidence": 0.9
-            }
+                })
+            )
+        
+        result = _classify_static(msg, skip_transaction=True)
+    
+    if result.intent == "typo_detected":
+        return replace(result, original_message=message)
+    return result
+
+
+@lru_cache(maxsize=4096)
+def _classify_static(msg: str, skip_transaction: bool = False) -> Optional[IntentResult]:
+    """
+    Classify a normalized message without touching the database.
+    Returns None when a saved beneficiary lookup is needed.
+    """
+    # Check for typos in common commands (best match over length-feasible variations)
+    candidates = _TYPO_CANDIDATES_BY_LEN[len(msg)] if len(msg) <= _TYPO_MAX_MSG_LEN else None
+    typo_match = candidates and process.extractOne(
+        msg, candidates, scorer=fuzz.ratio, score_cutoff=TYPO_SCORE_CUTOFF
+    )
+    if typo_match:
+        # Found potential typo - return with suggestion
+        return IntentResult(
+            intent="typo_detected",
+            handler="handle_typo_confirmation",
+            use_ai=False,
+            confidence=0.8,
+            suggested_intent=_TYPO_CANONICAL[typo_match[0]]
+        )
     
-    # Pattern 7: Buy airtime (no beneficiary)
-    if any(word in msg for word in ["airtime", "recharge", "topup", "top up"]):
+    # One sweep over the message finds every keyword bit
+    mask = match_keyword_mask(msg)
+    if msg.startswith("save "):
+        mask |= BIT_SAVE
+    if msg.startswith("delete ") or msg.startswith("remove "):
+        mask |= BIT_DELETE
+    if not mask & (BIT_SAVE | BIT_SHOW) and fuzzy_match_lower(msg, "show beneficiaries", 0.7):
+        mask |= BIT_SHOW
+    if skip_transaction:
+        mask &= ~BIT_TRANSACTION
+    
+    intent = _DISPATCH[mask]
+    
+    if intent == "beneficiary_transaction":
+        return None
+    
+    static = _STATIC_RESULTS.get(intent)
+    if static:
+        return static
+    
+    # Buy airtime (no beneficiary)
+    if intent == "buy_airtime":
         phone = extract_phone(msg)
         amount = extract_amount(msg)
         
-        return {
-            "intent": "buy_airtime",
-            "entities": {
+        return IntentResult(
+            intent="buy_airtime",
+            handler="handle_buy_airtime" if (phone and amount) else None,
+            use_ai=not (phone and amount),  # Use AI if incomplete
+            confidence=0.85,
+            entities=MappingProxyType({
                 "phone": phone,
                 "amount": amount
-            },
-            "handler": "handle_buy_airtime" if (phone and amount) else None,
-            "use_ai": not (phone and amount),  # Use AI if incomplete
-            "confidence": 0.85
-        }
+            })
+        )
     
-    # Pattern 7: Buy data
-    if any(word in msg for word in ["data", "bundle", "gigs", "gb", "mb"]):
+    # Buy data
+    if intent == "buy_data":
         phone = extract_phone(msg)
         amount = extract_amount(msg)
         
-        return {
-            "intent": "buy_data",
-            "entities": {
+        return IntentResult(
+            intent="buy_data",
+            handler=None,  # Not implemented yet
+            use_ai=True,
+            confidence=0.85,
+            entities=MappingProxyType({
                 "phone": phone,
                 "amount": amount
-            },
-            "handler": None,  # Not implemented yet
-            "use_ai": True,
-            "confidence": 0.85
-        }
-    
-    # Pattern 8: Electricity (no beneficiary)
-    if any(word in msg for word in ["electricity", "power", "token", "eskom", "meter"]):
-        meter = extract_meter_number(msg)
-        amount = extract_amount(msg)
-        
-        return {
-            "intent": "buy_electricity",
-            "entities": {
-                "meter_number": meter,
-                "amount": amount
-            },
-            "handler": None,  # Not implemented yet
-            "use_ai": True,
-            "confidence": 0.85
-        }
+            })
+        )
     
-    # Pattern 9: Greetings
-    if any(word in msg for word in ["hi", "hello", "hey", "start", "menu"]):
-        return {
-            "intent": "greeting",
-            "entities": {},
-            "handler": None,
-            "use_ai": True,  # AI gives friendly greeting
-            "confidence": 0.9
-        }
+    # Electricity (no beneficiary)
+    meter = extract_meter_number(msg)
+    amount = extract_amount(msg)
     
-    # Pattern 10: Help
-    if any(word in msg for word in ["help", "what can", "commands", "options"]):
-        return {
-            "intent": "help",
-            "entities": {},
-            "handler": "send_menu",
-            "use_ai": False,
-            "confidence": 0.95
-        }
-    
-    # Default: Unclear - use AI
-    return {
-        "intent": "unclear",
-        "entities": {},
-        "handler": None,
-        "use_ai": True,
-        "confidence": 0.5
-    }
+    return IntentResult(
+        intent="buy_electricity",
+        handler=None,  # Not implemented yet
+        use_ai=True,
+        confidence=0.85,
+        entities=MappingProxyType({
+            "meter_number": meter,
+            "amount": amount
+        })
+    )
+
+
+def _has_transaction_signal(msg: str) -> bool:
+    """
+    Whether a verb-bearing message carries an entity worth building the
+    nickname index for: an amount, a phone number, or a non-filler word
+    """
+    return (
+        extract_amount(msg) is not None
+        or extract_phone(msg) is not None
+        or any(word not in _NON_NICKNAME_WORDS for word in _WORD_RE.findall(msg))
+    )
 
 
 def extract_amount(text: str) -> Optional[float]:
-    """Extract monetary amount from text."""
-    patterns = [
-        r'r\s*(\d+(?:\.\d{2})?)',  # R50 or R 50
-        r'(\d+(?:\.\d{2})?)\s*rand',  # 50 rand
-        r'\b(\d+(?:\.\d{2})?)\b'  # Just numbers
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text.lower())
-        if match:
-            try:
-                return float(match.group(1))
-            except:
-                continue
+    """Extract monetary amount from (lowercased) text."""
+    best = None
+    best_priority = len(_AMOUNT_PRIORITY)
+    for match in _AMOUNT_RE.finditer(text):
+        priority = _AMOUNT_PRIORITY[match.lastgroup]
+        if priority < best_priority:
+            best, best_priority = match, priority
+            if priority == 0:
+                break
+    if best:
+        return float(best.group(best.lastgroup))
     return None
 
 
 def extract_phone(text: str) -> Optional[str]:
     """Extract South African phone number from text."""
-    patterns = [
-        r'(\+27\d{9})',  # +27821234567
-        r'(0\d{9})',  # 0821234567
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text)
-        if match:
-            phone = match.group(1).replace(' ', '')
-            return phone
-    return None
+    first_local = None
+    for match in _PHONE_RE.finditer(text):
+        if match.lastgroup == "intl":
+            return match.group("intl")
+        if first_local is None:
+            first_local = match.group("local")
+    return first_local
 
 
 def extract_meter_number(text: str) -> Optional[str]:
     """Extract electricity meter number from text."""
-    pattern = r'\b(\d{11})\b'
-    match = re.search(pattern, text)
+    match = _METER_RE.search(text)
     if match:
         return match.group(1)
     return None
 
 
 def extract_network(text: str) -> Optional[str]:
-    """Extract mobile network from text."""
-    text_lower = text.lower()
-    networks = {
-        "mtn": ["mtn"],
-        "vodacom": ["vodacom", "voda"],
-        "cell c": ["cell c", "cellc", "cell-c"],
-        "telkom": ["telkom"]
-    }
-    
-    for network, keywords in networks.items():
-        if any(keyword in text_lower for keyword in keywords):
-            return network
-    return None
\ No newline at end of file
+    """Extract mobile network from text (whole words only)."""
+    match = _NETWORK_RE.search(text)
+    if match:
+        return _NETWORK_NAMES[match.group(1).lower()]
+    return None
@@ -3,9 +3,11 @@ Onboarding Service
 Handles new user registration with WhatsApp Flows for KYC collection
 """
 import re
+import json
 import logging
 from datetime import datetime, date
 from typing import Dict, Optional, Tuple
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 import hashlib
 
@@ -14,6 +16,12 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# SA ID: YYMMDD GSSS CAZ (ASCII digits only)
+_SA_ID_RE = re.compile(r"([0-9]{2})([0-9]{2})([0-9]{2})([0-9]{4})[0-9]{3}")
+
+# Names: letters, spaces, hyphens, apostrophes
+_NAME_RE = re.compile(r"^[a-zA-Z\s'-]+$")
+
 
 class OnboardingService:
     """
@@ -28,21 +36,17 @@ class OnboardingService:
         Format: YYMMDD GSSS CAZ
         Returns: (is_valid, date_of_birth, gender)
         """
-        if not id_number or len(id_number) != 13:
-            return False, None, None
-        
-        if not id_number.isdigit():
+        match = _SA_ID_RE.fullmatch(id_number or "")
+        if not match:
             return False, None, None
         
         try:
-            # Extract date components
-            year = int(id_number[0:2])
-            month = int(id_number[2:4])
-            day = int(id_number[4:6])
+            # Extract date and gender components in one C-level pass
+            year, month, day, gender_code = map(int, match.groups())
             
-            # Determine century (assume < 25 is 2000s, else 1900s)
-            current_year = datetime.now().year % 100
-            if year <= current_year:
+            # Determine century (assume <= current YY is 2000s, else 1900s)
+            today = date.today()
+            if year <= today.year % 100:
                 year += 2000
             else:
                 year += 1900
@@ -51,11 +55,10 @@ class OnboardingService:
             dob = date(year, month, day)
             
             # Extract gender (0-4999 = Female, 5000-9999 = Male)
-            gender_code = int(id_number[6:10])
             gender = "Male" if gender_code >= 5000 else "Female"
             
-            # Calculate age
-            age = (datetime.now().date() - dob).days // 365
+            # Calculate age (whole years, birthday-aware)
+            age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
             
             # Must be 18+
             if age < 18:
@@ -71,9 +74,20 @@ class OnboardingService:
     @staticmethod
     def create_whatsapp_flow_json() -> Dict:
         """
-        Create WhatsApp Flow JSON for KYC data collection.
+        WhatsApp Flow JSON for KYC data collection.
         This is the interactive form that appears as a mini-app in WhatsApp.
+        The dict is built once and shared - callers must not mutate it.
         """
+        return _FLOW_JSON
+    
+    @staticmethod
+    def create_whatsapp_flow_json_str() -> str:
+        """Compact pre-serialized Flow JSON, ready to send as a request body."""
+        return _FLOW_JSON_STR
+    
+    @staticmethod
+    def _build_flow_json() -> Dict:
+        """Build the static Flow definition (run once at import)."""
         return {
             "version": "3.0",
             "screens": [
@@ -230,7 +244,7 @@ class OnboardingService:
                 return False, "❌ All fields are required. Please try again.", None
             
             # Validate name format
-            if not re.match(r"^[a-zA-Z\s'-]+$", first_name) or not re.match(r"^[a-zA-Z\s'-]+$", last_name):
+            if not _NAME_RE.match(first_name) or not _NAME_RE.match(last_name):
                 return False, "❌ Names can only contain letters, spaces, hyphens, and apostrophes.", None
             
             # Validate SA ID number
@@ -241,13 +255,19 @@ class OnboardingService:
                 else:
                     return False, "❌ Invalid South African ID number. Please check and try again.", None
             
+            # Look up this phone number and this ID number in one round trip
+            # (both columns are unique, so at most two rows come back)
+            matches = db.query(User).filter(
+                or_(User.phone_number == phone_number, User.id_number == id_number)
+            ).all()
+            
             # Check if user already exists
-            existing_user = db.query(User).filter(User.phone_number == phone_number).first()
+            existing_user = next((u for u in matches if u.phone_number == phone_number), None)
             if existing_user and existing_user.is_fica_compliant:
                 return False, "✅ You already have an account! Just send a message to get started.", existing_user
             
             # Check if ID number already used
-            id_exists = db.query(User).filter(User.id_number == id_number).first()
+            id_exists = any(u.id_number == id_number for u in matches)
             if id_exists:
                 return False, "❌ This ID number is already registered. Contact support if this is an error.", None
             
@@ -280,8 +300,9 @@ class OnboardingService:
                 )
                 db.add(user)
             
+            # No refresh: callers don't read the user back, and any attribute
+            # access after commit lazy-loads it anyway
             db.commit()
-            db.refresh(user)
             
             logger.info(f"User onboarded successfully: {phone_number}")
             
@@ -387,5 +408,9 @@ Reply "REGISTER" to continue setup.
         return "✅ Account ready! What can I help you with?"
 
 
+# Static Flow definition, built once
+_FLOW_JSON = OnboardingService._build_flow_json()
+_FLOW_JSON_STR = json.dumps(_FLOW_JSON, separators=(",", ":"), ensure_ascii=False)
+
 # Singleton instance
 onboarding_service = OnboardingService()
\ No newline at end of file
@@ -26,6 +26,23 @@ class PayStackService:
             "Authorization": f"Bearer {self.secret_key}",
             "Content-Type": "application/json"
         }
+        # One pooled client for the process; keep-alive saves a TCP+TLS handshake per call
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=20)
+        )
+        # Keyed HMAC state built once; each webhook copies it instead of re-keying
+        self._hmac_prototype = hmac.new(
+            settings.PAYSTACK_WEBHOOK_SECRET.encode(),
+            None,
+            hashlib.sha512
+        )
+    
+    async def aclose(self):
+        """Close the pooled HTTP client (called on application shutdown)."""
+        await self._client.aclose()
     
     async def initialize_payment(
         self,
@@ -52,22 +69,16 @@ class PayStackService:
             if metadata:
                 payload["metadata"] = metadata
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/transaction/initialize",
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                if result.get("status"):
-                    logger.info(f"Payment initialized: {reference}")
-                    return result.get("data", {})
-                else:
-                    raise Exception(result.get("message", "Payment initialization failed"))
-                    
+            response = await self._client.post("/transaction/initialize", json=payload)
+            response.raise_for_status()
+            result = response.json()
+            
+            if result.get("status"):
+                logger.info(f"Payment initialized: {reference}")
+                return result.get("data", {})
+            else:
+                raise Exception(result.get("message", "Payment initialization failed"))
+            
         except httpx.HTTPStatusError as e:
             logger.error(f"PayStack API error: {e.response.text}")
             raise
@@ -78,22 +89,17 @@ class PayStackService:
     async def verify_payment(self, reference: str) -> Dict:
         """Verify a payment transaction."""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/transaction/verify/{reference}",
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                if result.get("status"):
-                    data = result.get("data", {})
-                    logger.info(f"Payment verified: {reference} - {data.get('status')}")
-                    return data
-                else:
-                    raise Exception(result.get("message", "Payment verification failed"))
-                    
+            response = await self._client.get(f"/transaction/verify/{reference}")
+            response.raise_for_status()
+            result = response.json()
+            
+            if result.get("status"):
+                data = result.get("data", {})
+                logger.info(f"Payment verified: {reference} - {data.get('status')}")
+                return data
+            else:
+                raise Exception(result.get("message", "Payment verification failed"))
+            
         except Exception as e:
             logger.error(f"Failed to verify payment: {str(e)}")
             raise
@@ -126,37 +132,33 @@ class PayStackService:
                 "service_type": bill_code
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/bill/pay",
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                if result.get("status"):
-                    logger.info(f"Airtime purchased: {phone_number} - R{amount}")
-                    return result.get("data", {})
-                else:
-                    raise Exception(result.get("message", "Airtime purchase failed"))
-                    
+            response = await self._client.post("/bill/pay", json=payload)
+            response.raise_for_status()
+            result = response.json()
+            
+            if result.get("status"):
+                logger.info(f"Airtime purchased: {phone_number} - R{amount}")
+                return result.get("data", {})
+            else:
+                raise Exception(result.get("message", "Airtime purchase failed"))
+            
         except Exception as e:
             logger.error(f"Failed to buy airtime: {str(e)}")
             raise
     
-    @staticmethod
-    def verify_webhook_signature(payload: bytes, signature: str) -> bool:
+    def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
         """Verify webhook signature from PayStack."""
         try:
-            expected_signature = hmac.new(
-                settings.PAYSTACK_WEBHOOK_SECRET.encode(),
-                payload,
-                hashlib.sha512
-            ).hexdigest()
+            # Compare raw digests rather than hex-encoding ours
+            try:
+                signature_bytes = bytes.fromhex(signature)
+            except ValueError:
+                return False
+            
+            h = self._hmac_prototype.copy()
+            h.update(payload)
             
-            return hmac.compare_digest(expected_signature, signature)
+            return hmac.compare_digest(h.digest(), signature_bytes)
             
         except Exception as e:
             logger.error(f"Webhook signature verification failed: {str(e)}")
@@ -0,0 +1,165 @@
+"""
+Outbound rate limiting for the WhatsApp Cloud API
+Sliding-window RPM cap (proactive) + AIMD concurrency control (reactive)
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean "slow down": halve concurrency
+THROTTLE_STATUSES = frozenset({429, 503})
+
+
+class SlidingWindowLimiter:
+    """
+    At most `rpm` acquisitions in any trailing 60s window.
+    Throttles before the API has to reject anything.
+    """
+
+    def __init__(self, rpm: int, window: float = 60.0):
+        self.rpm = rpm
+        self.window_seconds = window
+        self.window: deque = deque()
+        self._lock = asyncio.Lock()
+        self._resume_at = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Hold all acquisitions for `seconds` (Retry-After / usage throttle)."""
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        # Serialized so concurrent callers can't both take the last slot
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+
+                cutoff = now - self.window_seconds
+                while self.window and self.window[0] <= cutoff:
+                    self.window.popleft()
+
+                if len(self.window) < self.rpm:
+                    self.window.append(now)
+                    return
+
+                await asyncio.sleep(self.window[0] - cutoff)
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease cap on requests in flight.
+    Halves on throttling, grows by `increase` per fast success.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        increase: float = 0.5,
+        target_latency: float = 1.0
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.increase = increase
+        self.target_latency = target_latency
+        self.concurrency = float(max_concurrency)
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < int(self.concurrency))
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def on_error(self) -> None:
+        self.concurrency = max(self.min_concurrency, self.concurrency * 0.5)
+        logger.warning(f"Throttled: concurrency cut to {int(self.concurrency)}")
+
+    def on_success(self, latency: float) -> None:
+        if latency <= self.target_latency:
+            self.concurrency = min(self.max_concurrency, self.concurrency + self.increase)
+
+
+def _throttle_seconds(response: httpx.Response) -> Optional[float]:
+    """Wait requested by Retry-After or Meta's x-business-use-case-usage header"""
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    usage = response.headers.get("x-business-use-case-usage")
+    if usage:
+        try:
+            minutes = max(
+                entry.get("estimated_time_to_regain_access", 0)
+                for entries in json.loads(usage).values()
+                for entry in entries
+            )
+            if minutes:
+                return minutes * 60.0
+        except (ValueError, TypeError, AttributeError):
+            pass
+
+    return None
+
+
+class AsyncRateLimiter:
+    """
+    Sliding window + AIMD, shared by every outbound send:
+
+        async with limiter.slot():
+            response = await client.post(...)
+            limiter.observe(response, latency)
+    """
+
+    def __init__(self, rpm: int, max_concurrency: int):
+        self.window = SlidingWindowLimiter(rpm)
+        self.aimd = AIMDController(max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self.aimd.slot():
+            await self.window.acquire()
+            yield
+
+    def observe(self, response: httpx.Response, latency: float) -> None:
+        """Feed a response back: throttles shrink/pause, fast successes grow."""
+        pause = _throttle_seconds(response)
+        if pause:
+            self.window.pause(pause)
+
+        if response.status_code in THROTTLE_STATUSES:
+            self.aimd.on_error()
+        elif response.status_code < 400:
+            self.aimd.on_success(latency)
+
+
+@lru_cache(maxsize=1)
+def get_whatsapp_limiter() -> AsyncRateLimiter:
+    """
+    The one limiter for the WhatsApp messages endpoint. The quota belongs to
+    the phone number, so every service posting there must share it.
+    """
+    return AsyncRateLimiter(rpm=int(settings.WHATSAPP_MPS * 60), max_concurrency=50)
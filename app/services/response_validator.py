@@ -3,9 +3,79 @@ Response Validator - Catch AI Hallucinations
 Prevents AI from making up actions or features
 """
 import logging
+import re
+import ahocorasick
 
 logger = logging.getLogger(__name__)
 
+# Hallucination patterns - AI pretending to do actions
+HALLUCINATION_PATTERNS = (
+    "let me check",
+    "i'll check",
+    "i'm checking",
+    "hold on",
+    "please wait",
+    "one moment",
+    "i need to save",
+    "i'll need to save",
+    "i'll save",
+    "let me save",
+    "checking now",
+    "checking your",
+    "i'll verify",
+    "verifying",
+    "processing",
+    "i'll process",
+    "adding to"
+)
+
+# Invented features - things Cyrax can't actually do
+INVENTED_FEATURES = (
+    "add funds to your wallet",
+    "top up your wallet",
+    "deposit",
+    "transfer money"
+)
+
+# Action phrases stripped by sanitize_response (case-sensitive, as written)
+ACTION_PHRASES = (
+    "I'll ",
+    "I will ",
+    "Let me ",
+    "I'm going to ",
+)
+
+_HALLUCINATION = "hallucination"
+_INVENTED = "invented"
+
+
+def _build_pattern_automaton() -> ahocorasick.Automaton:
+    """One automaton over both pattern lists, valued by (kind, pattern)"""
+    automaton = ahocorasick.Automaton()
+    for pattern in INVENTED_FEATURES:
+        automaton.add_word(pattern, (_INVENTED, pattern))
+    for pattern in HALLUCINATION_PATTERNS:
+        automaton.add_word(pattern, (_HALLUCINATION, pattern))
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_action_phrase_re() -> re.Pattern:
+    """
+    Alternation factored on first character, so re tests one branch per position.
+    Longest phrases go first so one that contains another is removed whole.
+    """
+    by_first: dict[str, list[str]] = {}
+    for phrase in sorted(ACTION_PHRASES, key=len, reverse=True):
+        by_first.setdefault(phrase[0], []).append(re.escape(phrase[1:]))
+    return re.compile("|".join(
+        f"{re.escape(first)}(?:{'|'.join(rests)})" for first, rests in by_first.items()
+    ))
+
+
+_PATTERN_AUTOMATON = _build_pattern_automaton()
+_ACTION_PHRASE_RE = _build_action_phrase_re()
+
 
 def validate_ai_response(response: str) -> tuple[bool, str]:
     """
@@ -14,51 +84,23 @@ def validate_ai_response(response: str) -> tuple[bool, str]:
     Returns:
         (is_valid, corrected_response)
     """
-    
-    # Hallucination patterns - AI pretending to do actions
-    hallucination_patterns = [
-        "let me check",
-        "i'll check",
-        "i'm checking",
-        "hold on",
-        "please wait",
-        "one moment",
-        "i need to save",
-        "i'll need to save",
-        "i'll save",
-        "let me save",
-        "checking now",
-        "checking your",
-        "i'll verify",
-        "verifying",
-        "processing",
-        "i'll process",
-        "adding to"
-    ]
-    
     response_lower = response.lower()
     
-    # Check for hallucinations
-    for pattern in hallucination_patterns:
-        if pattern in response_lower:
+    # Single pass over the response; hallucinations outrank invented features
+    invented = None
+    for _, (kind, pattern) in _PATTERN_AUTOMATON.iter(response_lower):
+        if kind == _HALLUCINATION:
             logger.warning(f"Hallucination detected: '{pattern}' in response")
             
             # Return safe fallback
             return False, "I can help with that! What would you like to do?"
+        if invented is None:
+            invented = pattern
     
-    # Check for invented features
-    invented_features = [
-        "add funds to your wallet",
-        "top up your wallet",
-        "deposit",
-        "transfer money"
-    ]
-    
-    for feature in invented_features:
-        if feature in response_lower:
-            logger.warning(f"Invented feature detected: '{feature}'")
-            
-            return False, "I can help with airtime, data, and electricity. What would you like?"
+    if invented:
+        logger.warning(f"Invented feature detected: '{invented}'")
+        
+        return False, "I can help with airtime, data, and electricity. What would you like?"
     
     return True, response
 
@@ -67,16 +109,5 @@ def sanitize_response(response: str) -> str:
     """
     Remove problematic phrases from AI response.
     """
-    # Remove action phrases
-    action_phrases = [
-        "I'll ",
-        "I will ",
-        "Let me ",
-        "I'm going to ",
-    ]
-    
-    sanitized = response
-    for phrase in action_phrases:
-        sanitized = sanitized.replace(phrase, "")
-    
-    return sanitized.strip()
\ No newline at end of file
+    # Remove action phrases in one regex pass
+    return _ACTION_PHRASE_RE.sub("", response).strip()
@@ -4,8 +4,11 @@ Handles PIN hashing, verification, and fraud detection for Cyrax
 """
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
+import asyncio
 import logging
+from functools import lru_cache
 from typing import Optional, Tuple
 import re
 
@@ -14,7 +17,59 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
+
+# Round amounts watched for repeated-purchase fraud patterns
+# (set for membership checks, tuple for the SQL IN clause)
+_ROUND_AMOUNTS_TUPLE = (100, 200, 500, 1000, 2000, 5000)
+_ROUND_AMOUNTS = frozenset(_ROUND_AMOUNTS_TUPLE)
+
+# PINs rejected as too easy to guess
+_WEAK_PINS = frozenset({
+    "0000", "1111", "2222", "3333", "4444", "5555",
+    "6666", "7777", "8888", "9999", "1234", "4321"
+})
+
+# Input sanitization patterns, fused into one alternation
+_DANGEROUS_RE = re.compile(
+    r"(?i:DROP|DELETE|INSERT|UPDATE|ALTER|CREATE|EXEC|EXECUTE|SCRIPT)"
+    r"|[<>]"
+    r"|javascript:"
+)
+
+# str.translate table deleting every non-digit ASCII character; the regex
+# only runs on the rare input with non-ASCII characters left over
+_NON_DIGIT_TABLE = {c: None for c in range(128) if not 48 <= c <= 57}
+_NON_DIGIT_RE = re.compile(r'\D')
+
+
+def _norm_pin(pin) -> str:
+    """
+    Normalize raw PIN input. Called once at the boundary (verify_user_pin,
+    set_user_pin); hash_pin/verify_pin/validate_pin_format take its output.
+    """
+    return str(pin).strip()
+
+
+@lru_cache(maxsize=4096)  # bounded: at most 4096 distinct numbers held
+def _validate_phone(phone: str) -> Tuple[bool, str]:
+    """Pure phone validation behind SecurityService.validate_phone_number"""
+    cleaned = phone.translate(_NON_DIGIT_TABLE)
+    if not cleaned.isascii():
+        cleaned = _NON_DIGIT_RE.sub('', cleaned)
+    
+    if len(cleaned) == 10 and cleaned.startswith('0'):
+        return True, cleaned
+    elif len(cleaned) == 11 and cleaned.startswith('27'):
+        return True, cleaned
+    elif len(cleaned) == 9:
+        return True, f"27{cleaned}"
+    
+    return False, ""
 
 
 class SecurityService:
@@ -24,17 +79,21 @@ class SecurityService:
     
     @staticmethod
     def hash_pin(pin: str) -> str:
-        """Hash a PIN securely using bcrypt."""
-        # Ensure PIN is properly encoded and limited to 72 bytes
-        pin_str = str(pin).strip()
-        pin_bytes = pin_str.encode('utf-8')[:72]
+        """
+        Hash a PIN securely using bcrypt.
+        Expects a normalized PIN (_norm_pin); it is not cleaned again here.
+        """
+        # Limit to bcrypt's 72-byte input
+        pin_bytes = pin.encode('utf-8')[:72]
         return pwd_context.hash(pin_bytes.decode('utf-8'))
     
     @staticmethod
     def verify_pin(plain_pin: str, hashed_pin: str) -> bool:
-        """Verify a PIN against its hash."""
+        """
+        Verify a PIN against its hash.
+        Expects a normalized plain_pin (_norm_pin); it is not cleaned again here.
+        """
         try:
-            plain_pin = str(plain_pin).strip()
             return pwd_context.verify(plain_pin, hashed_pin)
         except Exception as e:
             logger.error(f"PIN verification error: {str(e)}")
@@ -42,9 +101,10 @@ class SecurityService:
     
     @staticmethod
     def validate_pin_format(pin: str) -> Tuple[bool, str]:
-        """Validate PIN format."""
-        pin = str(pin).strip()
-        
+        """
+        Validate PIN format.
+        Expects a normalized PIN (_norm_pin); it is not cleaned again here.
+        """
         if not pin:
             return False, "PIN is required"
         
@@ -54,9 +114,7 @@ class SecurityService:
         if len(pin) < 4 or len(pin) > 6:
             return False, "PIN must be 4-6 digits"
         
-        weak_pins = ["0000", "1111", "2222", "3333", "4444", "5555", 
-                     "6666", "7777", "8888", "9999", "1234", "4321"]
-        if pin in weak_pins:
+        if pin in _WEAK_PINS:
             return False, "PIN is too weak. Choose a stronger PIN"
         
         return True, ""
@@ -69,6 +127,8 @@ class SecurityService:
     ) -> Tuple[bool, str]:
         """Verify user's transaction PIN with rate limiting."""
         try:
+            pin = _norm_pin(pin)
+            
             user = db.query(User).filter(User.id == user_id).first()
             if not user:
                 return False, "User not found"
@@ -80,7 +140,8 @@ class SecurityService:
             if not user.pin_hash:
                 return False, "Please set up your PIN first. Reply 'SET PIN' to create one"
             
-            if SecurityService.verify_pin(pin, user.pin_hash):
+            # bcrypt is CPU-bound by design - keep it off the event loop
+            if await asyncio.to_thread(SecurityService.verify_pin, pin, user.pin_hash):
                 user.pin_attempts = 0
                 user.pin_locked_until = None
                 db.commit()
@@ -109,8 +170,8 @@ class SecurityService:
     ) -> Tuple[bool, str]:
         """Set or update user's transaction PIN."""
         try:
-            # Clean the PIN - ensure it's a string and trimmed
-            new_pin = str(new_pin).strip()
+            # Clean the PIN once - internal helpers take it as-is
+            new_pin = _norm_pin(new_pin)
             
             # Validate format
             is_valid, error_msg = SecurityService.validate_pin_format(new_pin)
@@ -123,7 +184,7 @@ class SecurityService:
                 return False, "User not found"
             
             # Hash PIN using the fixed hash_pin method
-            user.pin_hash = SecurityService.hash_pin(new_pin)
+            user.pin_hash = await asyncio.to_thread(SecurityService.hash_pin, new_pin)
             user.pin_attempts = 0
             user.pin_locked_until = None
             db.commit()
@@ -139,16 +200,7 @@ class SecurityService:
     @staticmethod
     def validate_phone_number(phone: str) -> Tuple[bool, str]:
         """Validate South African phone number."""
-        cleaned = re.sub(r'\D', '', phone)
-        
-        if len(cleaned) == 10 and cleaned.startswith('0'):
-            return True, cleaned
-        elif len(cleaned) == 11 and cleaned.startswith('27'):
-            return True, cleaned
-        elif len(cleaned) == 9:
-            return True, f"27{cleaned}"
-        
-        return False, ""
+        return _validate_phone(phone)
     
     @staticmethod
     def detect_fraud(
@@ -169,33 +221,41 @@ class SecurityService:
                 if amount > 1000:
                     return True, "High amount for new account. Please verify your identity first"
             
-            recent_transactions = db.query(Transaction).filter(
+            # All window counts in one round trip, scanning the widest window once
+            now = datetime.utcnow()
+            since_5m = now - timedelta(minutes=5)
+            since_10m = now - timedelta(minutes=10)
+            since_1h = now - timedelta(hours=1)
+            check_round = amount in _ROUND_AMOUNTS
+            
+            counts = [
+                func.count().filter(Transaction.created_at > since_5m).label("recent"),
+            ]
+            if recipient_phone:
+                counts.append(func.count().filter(and_(
+                    Transaction.recipient_phone == recipient_phone,
+                    Transaction.created_at > since_10m
+                )).label("to_same"))
+            if check_round:
+                counts.append(func.count().filter(and_(
+                    Transaction.amount.in_(_ROUND_AMOUNTS_TUPLE),
+                    Transaction.created_at > since_1h
+                )).label("round_amounts"))
+            
+            window_start = since_1h if check_round else since_10m if recipient_phone else since_5m
+            row = db.query(*counts).filter(
                 Transaction.user_id == user_id,
-                Transaction.created_at > datetime.utcnow() - timedelta(minutes=5)
-            ).count()
+                Transaction.created_at > window_start
+            ).one()
             
-            if recent_transactions >= 5:
+            if row.recent >= 5:
                 return True, "Too many transactions in short time. Please wait a few minutes"
             
-            if recipient_phone:
-                recent_to_same = db.query(Transaction).filter(
-                    Transaction.user_id == user_id,
-                    Transaction.recipient_phone == recipient_phone,
-                    Transaction.created_at > datetime.utcnow() - timedelta(minutes=10)
-                ).count()
-                
-                if recent_to_same >= 3:
-                    return True, "Multiple transactions to same recipient. Please contact support"
-            
-            if amount in [100, 200, 500, 1000, 2000, 5000]:
-                recent_round = db.query(Transaction).filter(
-                    Transaction.user_id == user_id,
-                    Transaction.amount.in_([100, 200, 500, 1000, 2000, 5000]),
-                    Transaction.created_at > datetime.utcnow() - timedelta(hours=1)
-                ).count()
-                
-                if recent_round >= 3:
-                    return True, "Suspicious transaction pattern detected. Please verify via support"
+            if recipient_phone and row.to_same >= 3:
+                return True, "Multiple transactions to same recipient. Please contact support"
+            
+            if check_round and row.round_amounts >= 3:
+                return True, "Suspicious transaction pattern detected. Please verify via support"
             
             return False, ""
             
@@ -206,15 +266,11 @@ class SecurityService:
     @staticmethod
     def sanitize_input(text: str) -> str:
         """Sanitize user input to prevent injection attacks."""
-        dangerous_patterns = [
-            r"(?i)(DROP|DELETE|INSERT|UPDATE|ALTER|CREATE|EXEC|EXECUTE|SCRIPT)",
-            r"[<>]",
-            r"javascript:",
-        ]
-        
-        sanitized = text
-        for pattern in dangerous_patterns:
-            sanitized = re.sub(pattern, "", sanitized)
+        # One pass normally; repeat only if stripping formed a new match
+        # (e.g. "javaDROPscript:")
+        sanitized, removed = _DANGEROUS_RE.subn("", text)
+        while removed:
+            sanitized, removed = _DANGEROUS_RE.subn("", sanitized)
         
         return sanitized.strip()
 
@@ -2,10 +2,12 @@
 Transaction Service
 Orchestrates all transaction logic for Cyrax
 """
+from sqlalchemy import case, or_, select, text, update
 from sqlalchemy.orm import Session
-from typing import Dict, Optional, Tuple
+from typing import NamedTuple, Optional, Tuple
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+import secrets
 import uuid
 from decimal import Decimal
 
@@ -16,6 +18,46 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Static failure messages shared by the transaction methods
+_ERR_SENDER_NOT_FOUND = "Sender not found"
+_ERR_USER_NOT_FOUND = "User not found"
+_ERR_GENERIC = "An error occurred. Please try again."
+_ERR_TRANSFER_FAILED = "Transaction failed. Please try again."
+_ERR_AIRTIME_FAILED = "Airtime purchase failed. Please try again."
+_ERR_ELECTRICITY_FAILED = "Electricity purchase failed. Please try again."
+
+# Max wait for a wallet row lock before the transfer is aborted
+WALLET_LOCK_TIMEOUT = "5s"
+
+
+class Balance(NamedTuple):
+    """User's current balance and limits (use ._asdict() for JSON)"""
+    balance: float
+    daily_limit_remaining: float
+    monthly_limit_remaining: float
+    daily_spent: float
+    monthly_spent: float
+
+
+# Columns read by Transaction.serialize, for history listings
+_HISTORY_COLUMNS = (
+    Transaction.id,
+    Transaction.type,
+    Transaction.status,
+    Transaction.amount,
+    Transaction.total_amount,
+    Transaction.currency,
+    Transaction.description,
+    Transaction.recipient_name,
+    Transaction.created_at,
+    Transaction.completed_at,
+)
+
+
+def _as_uuid(value) -> uuid.UUID:
+    """Coerce an id to UUID so Session.get can hit the identity map"""
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
 
 class TransactionService:
     """
@@ -33,18 +75,42 @@ class TransactionService:
     ) -> Tuple[bool, str, Optional[Transaction]]:
         """Send money from one user to another."""
         try:
-            sender = db.query(User).filter(User.id == sender_id).first()
+            # Serialize concurrent transfers on the same wallet in the DB;
+            # lock_timeout bounds the wait (sync Session, so no asyncio.wait_for)
+            db.execute(text(f"SET LOCAL lock_timeout = '{WALLET_LOCK_TIMEOUT}'"))
+            sender_uuid = _as_uuid(sender_id)
+            recipient_id = db.query(User.id).filter(
+                User.phone_number == recipient_phone
+            ).scalar()
+            # Lock both wallets in id order, not transfer direction, so
+            # concurrent A->B and B->A transfers can't deadlock
+            locked = {
+                user.id: user
+                for user in db.query(User)
+                .filter(User.id.in_({sender_uuid, recipient_id} - {None}))
+                .order_by(User.id)
+                .with_for_update()
+                .populate_existing()
+            }
+            sender = locked.get(sender_uuid)
             if not sender:
-                return False, "Sender not found", None
+                db.rollback()
+                return False, _ERR_SENDER_NOT_FOUND, None
             
             can_transact, reason = sender.can_transact(amount)
             if not can_transact:
+                db.rollback()
                 return False, reason, None
             
-            if sender.balance < amount:
+            fee = max(1.0, min(amount * 0.01, 50.0))
+            total_amount = amount + fee
+            
+            # All rejections happen before the recipient placeholder INSERT
+            if sender.balance < total_amount:
+                db.rollback()
                 return False, f"Insufficient balance. Available: R{sender.balance:.2f}", None
             
-            recipient = db.query(User).filter(User.phone_number == recipient_phone).first()
+            recipient = locked.get(recipient_id)
             if not recipient:
                 recipient = User(
                     phone_number=recipient_phone,
@@ -53,9 +119,6 @@ class TransactionService:
                 db.add(recipient)
                 db.flush()
             
-            fee = max(1.0, min(amount * 0.01, 50.0))
-            total_amount = amount + fee
-            
             transaction = Transaction(
                 user_id=sender.id,
                 type=TransactionType.SEND_MONEY,
@@ -68,7 +131,7 @@ class TransactionService:
                 transaction_fee=fee,
                 total_amount=total_amount,
                 description=description,
-                payment_reference=f"CYR-{uuid.uuid4().hex[:12].upper()}",
+                payment_reference=f"CYR-{secrets.token_hex(6).upper()}",
                 balance_before=sender.balance
             )
             db.add(transaction)
@@ -97,12 +160,12 @@ class TransactionService:
                 db.commit()
                 
                 logger.error(f"Transfer failed: {str(e)}")
-                return False, "Transaction failed. Please try again.", transaction
+                return False, _ERR_TRANSFER_FAILED, transaction
                 
         except Exception as e:
             db.rollback()
             logger.error(f"Send money error: {str(e)}")
-            return False, "An error occurred. Please try again.", None
+            return False, _ERR_GENERIC, None
     
     @staticmethod
     async def buy_airtime(
@@ -114,9 +177,9 @@ class TransactionService:
     ) -> Tuple[bool, str, Optional[Transaction]]:
         """Purchase airtime for a phone number."""
         try:
-            user = db.query(User).filter(User.id == user_id).first()
+            user = db.get(User, _as_uuid(user_id))
             if not user:
-                return False, "User not found", None
+                return False, _ERR_USER_NOT_FOUND, None
             
             can_transact, reason = user.can_transact(amount)
             if not can_transact:
@@ -139,7 +202,7 @@ class TransactionService:
                 transaction_fee=fee,
                 total_amount=total_amount,
                 description=f"{provider} airtime for {phone_number}",
-                payment_reference=f"CYR-AIR-{uuid.uuid4().hex[:10].upper()}",
+                payment_reference=f"CYR-AIR-{secrets.token_hex(5).upper()}",
                 balance_before=user.balance
             )
             db.add(transaction)
@@ -175,12 +238,12 @@ class TransactionService:
                 db.commit()
                 
                 logger.error(f"Airtime purchase failed: {str(e)}")
-                return False, "Airtime purchase failed. Please try again.", transaction
+                return False, _ERR_AIRTIME_FAILED, transaction
                 
         except Exception as e:
             db.rollback()
             logger.error(f"Buy airtime error: {str(e)}")
-            return False, "An error occurred. Please try again.", None
+            return False, _ERR_GENERIC, None
     
     @staticmethod
     async def buy_electricity(
@@ -191,9 +254,9 @@ class TransactionService:
     ) -> Tuple[bool, str, Optional[Transaction]]:
         """Purchase prepaid electricity."""
         try:
-            user = db.query(User).filter(User.id == user_id).first()
+            user = db.get(User, _as_uuid(user_id))
             if not user:
-                return False, "User not found", None
+                return False, _ERR_USER_NOT_FOUND, None
             
             can_transact, reason = user.can_transact(amount)
             if not can_transact:
@@ -216,7 +279,7 @@ class TransactionService:
                 transaction_fee=fee,
                 total_amount=total_amount,
                 description=f"Prepaid electricity for meter {meter_number}",
-                payment_reference=f"CYR-ELEC-{uuid.uuid4().hex[:10].upper()}",
+                payment_reference=f"CYR-ELEC-{secrets.token_hex(5).upper()}",
                 balance_before=user.balance
             )
             db.add(transaction)
@@ -250,39 +313,65 @@ class TransactionService:
                 db.commit()
                 
                 logger.error(f"Electricity purchase failed: {str(e)}")
-                return False, "Electricity purchase failed. Please try again.", transaction
+                return False, _ERR_ELECTRICITY_FAILED, transaction
                 
         except Exception as e:
             db.rollback()
             logger.error(f"Buy electricity error: {str(e)}")
-            return False, "An error occurred. Please try again.", None
+            return False, _ERR_GENERIC, None
     
     @staticmethod
-    def get_user_balance(db: Session, user_id: str) -> Optional[Dict]:
+    def get_user_balance(db: Session, user_id: str) -> Optional[Balance]:
         """Get user's current balance and limits."""
         try:
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
+            # Read only the columns we report on, not the full user row
+            row = db.execute(
+                select(
+                    User.balance,
+                    User.daily_limit,
+                    User.monthly_limit,
+                    User.daily_spent,
+                    User.monthly_spent,
+                    User.last_daily_reset,
+                    User.last_monthly_reset
+                ).where(User.id == user_id)
+            ).first()
+            if not row:
                 return None
             
             now = datetime.utcnow()
-            if user.last_daily_reset.date() < now.date():
-                user.daily_spent = 0.0
-                user.last_daily_reset = now
-                db.commit()
+            today_start = datetime.combine(now.date(), time.min)
+            month_start = today_start.replace(day=1)
+            
+            daily_due = row.last_daily_reset < today_start
+            monthly_due = row.last_monthly_reset < month_start
+            daily_spent = 0.0 if daily_due else row.daily_spent
+            monthly_spent = 0.0 if monthly_due else row.monthly_spent
             
-            if user.last_monthly_reset.month < now.month or user.last_monthly_reset.year < now.year:
-                user.monthly_spent = 0.0
-                user.last_monthly_reset = now
+            if daily_due or monthly_due:
+                # One UPDATE, one commit; the reset conditions are re-checked in
+                # SQL so a concurrent request can't have its spend zeroed twice
+                daily_cond = User.last_daily_reset < today_start
+                monthly_cond = User.last_monthly_reset < month_start
+                db.execute(
+                    update(User)
+                    .where(User.id == user_id, or_(daily_cond, monthly_cond))
+                    .values(
+                        daily_spent=case((daily_cond, 0.0), else_=User.daily_spent),
+                        last_daily_reset=case((daily_cond, now), else_=User.last_daily_reset),
+                        monthly_spent=case((monthly_cond, 0.0), else_=User.monthly_spent),
+                        last_monthly_reset=case((monthly_cond, now), else_=User.last_monthly_reset)
+                    )
+                )
                 db.commit()
             
-            return {
-                "balance": user.balance,
-                "daily_limit_remaining": user.available_daily_limit,
-                "monthly_limit_remaining": user.available_monthly_limit,
-                "daily_spent": user.daily_spent,
-                "monthly_spent": user.monthly_spent
-            }
+            return Balance(
+                balance=row.balance,
+                daily_limit_remaining=max(0, row.daily_limit - daily_spent),
+                monthly_limit_remaining=max(0, row.monthly_limit - monthly_spent),
+                daily_spent=daily_spent,
+                monthly_spent=monthly_spent
+            )
             
         except Exception as e:
             logger.error(f"Get balance error: {str(e)}")
@@ -296,13 +385,16 @@ class TransactionService:
     ) -> list:
         """Get user's recent transactions."""
         try:
-            transactions = db.query(Transaction).filter(
-                Transaction.user_id == user_id
-            ).order_by(
-                Transaction.created_at.desc()
-            ).limit(limit).all()
+            # Project just the serialized columns - no full ORM hydration
+            # (ix_transaction_user_created serves the ORDER BY ... LIMIT)
+            rows = db.execute(
+                select(*_HISTORY_COLUMNS)
+                .where(Transaction.user_id == user_id)
+                .order_by(Transaction.created_at.desc())
+                .limit(limit)
+            ).all()
             
-            return [t.to_dict() for t in transactions]
+            return [Transaction.serialize(row) for row in rows]
             
         except Exception as e:
             logger.error(f"Get history error: {str(e)}")
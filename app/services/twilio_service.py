@@ -4,13 +4,46 @@ Handles WhatsApp messaging via Twilio with full media support
 """
 import httpx
 import logging
-from typing import Dict, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 from base64 import b64encode
+from urllib.parse import parse_qsl, quote_plus
 
 from app.config import settings
+from app.services._bulk import run_bounded
+from app.services._http import get_transport
+from app.services._retry import retry_async
 
 logger = logging.getLogger(__name__)
 
+# Characters dropped from phone numbers before re-adding the canonical "+"
+_PHONE_STRIP = str.maketrans("", "", "+ -()")
+
+# Templated system messages, filled with str.format_map
+MESSAGE_TEMPLATES = {
+    "otp": "🔐 Your Cyrax verification code is {code}. Don't share it with anyone.",
+    "balance_reminder": "💰 Your Cyrax balance is R{balance}.",
+}
+
+# Webhook form fields parse_webhook reads; Twilio sends ~30 others we drop
+_WEBHOOK_KEYS = frozenset({
+    "From", "Body", "MessageSid", "ProfileName",
+    "NumMedia", "MediaContentType0", "MediaUrl0",
+})
+
+# MIME major type -> inbound message type; captions kept for image/video only
+_MEDIA_TYPE = {"image": "image", "audio": "audio", "video": "video"}
+_CAPTIONED_TYPES = frozenset({"image", "video"})
+
+
+@lru_cache(maxsize=1024)
+def _form_quote(value: str) -> bytes:
+    """
+    urlencode a From/To number (repeat recipients hit the cache). Never pass
+    message bodies: they'd pin OTP/PIN text in memory and rarely repeat
+    """
+    return quote_plus(value).encode()
+
 
 class TwilioWhatsAppService:
     """
@@ -30,6 +63,31 @@ class TwilioWhatsAppService:
             "Authorization": f"Basic {credentials}",
             "Content-Type": "application/x-www-form-urlencoded"
         }
+        # Client over the shared pooled transport (app/services/_http.py)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            transport=get_transport(),
+            timeout=30.0
+        )
+        # Pre-encoded form prefix shared by every templated send
+        self._form_prefix = b"From=" + _form_quote(self.from_number) + b"&To="
+    
+    async def warm_up(self) -> None:
+        """Open the TLS/HTTP2 connection at startup so the first send skips the handshake."""
+        try:
+            await self.client.get("/Messages.json", params={"PageSize": 1}, timeout=5.0)
+        except Exception as e:
+            logger.warning(f"Twilio warm-up failed: {str(e)}")
+    
+    async def _post_message(self, **kwargs) -> httpx.Response:
+        """POST to Messages.json, retrying only failures Twilio never processed (no double sends)."""
+        async def post():
+            response = await self.client.post("/Messages.json", **kwargs)
+            response.raise_for_status()
+            return response
+        
+        return await retry_async(post)
     
     async def send_message(self, to_phone: str, message: str) -> Dict:
         """
@@ -43,33 +101,19 @@ class TwilioWhatsAppService:
             Response from Twilio
         """
         try:
-            # Clean phone number
-            if not to_phone.startswith("+"):
-                to_phone = f"+{to_phone}"
-            
-            # Add whatsapp: prefix
-            to_whatsapp = f"whatsapp:{to_phone}"
-            
             # Prepare data
             data = {
                 "From": self.from_number,
-                "To": to_whatsapp,
+                "To": self._to_whatsapp(to_phone),
                 "Body": message
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Messages.json",
-                    headers=self.headers,
-                    data=data,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                logger.info(f"Message sent to {to_phone}: {result.get('sid')}")
-                return result
-                
+            response = await self._post_message(data=data)
+            result = response.json()
+            
+            logger.info(f"Message sent to {to_phone}: {result.get('sid')}")
+            return result
+            
         except httpx.HTTPStatusError as e:
             logger.error(f"Twilio API error: {e.response.text}")
             raise
@@ -77,6 +121,83 @@ class TwilioWhatsAppService:
             logger.error(f"Failed to send message: {str(e)}")
             raise
     
+    async def send_messages_bulk(
+        self,
+        items: List[Tuple[str, str]],
+        concurrency: int = 50
+    ) -> List[Union[Dict, BaseException]]:
+        """
+        Send many text messages concurrently over the pooled connections.
+        
+        Args:
+            items: (to_phone, message) pairs
+            concurrency: Max sends in flight at once
+            
+        Returns:
+            One entry per item, in order: the API response, or the exception
+            that send_message raised for that item (failures don't abort the rest)
+        """
+        # Fixed pool of workers over the pooled connections; see run_bounded
+        # for why there is no per-message yield
+        return await run_bounded(self.send_message, items, concurrency)
+    
+    async def send_message_template(self, to_phone: str, template_id: str, **vars) -> Dict:
+        """
+        Send a templated system message (OTP, balance reminder, ...).
+        The form body is assembled from pre-encoded bytes instead of
+        urlencoding a fresh dict on every send.
+        
+        Args:
+            to_phone: Recipient phone (format: +27821234567)
+            template_id: Key into MESSAGE_TEMPLATES
+            **vars: Values for the template placeholders
+            
+        Returns:
+            Response from Twilio
+        """
+        try:
+            body = MESSAGE_TEMPLATES[template_id].format_map(vars)
+            content = (
+                self._form_prefix + _form_quote(self._to_whatsapp(to_phone))
+                + b"&Body=" + quote_plus(body).encode()
+            )
+            
+            response = await self._post_message(content=content)
+            result = response.json()
+            
+            logger.info(f"Template '{template_id}' sent to {to_phone}: {result.get('sid')}")
+            return result
+            
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Twilio API error: {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to send template message: {str(e)}")
+            raise
+    
+    @staticmethod
+    def _to_whatsapp(to_phone: str) -> str:
+        """Normalize to "whatsapp:+<number>" (already-prefixed numbers pass through)"""
+        if to_phone[:9] == "whatsapp:":
+            return to_phone
+        return "whatsapp:+" + to_phone.translate(_PHONE_STRIP)
+    
+    @staticmethod
+    def webhook_form(raw: bytes) -> Dict[str, str]:
+        """
+        Decode a raw x-www-form-urlencoded webhook body, keeping only the
+        fields parse_webhook reads.
+        """
+        return {
+            k: v for k, v in parse_qsl(raw.decode(), keep_blank_values=True)
+            if k in _WEBHOOK_KEYS
+        }
+    
+    @staticmethod
+    def parse_webhook_bytes(raw: bytes) -> Optional[Dict]:
+        """parse_webhook straight from the raw request body (no full form dict)."""
+        return TwilioWhatsAppService.parse_webhook(TwilioWhatsAppService.webhook_form(raw))
+    
     @staticmethod
     def parse_webhook(form_data: Dict) -> Optional[Dict]:
         """
@@ -91,11 +212,15 @@ class TwilioWhatsAppService:
         """
         try:
             # Basic message info
-            from_number = form_data.get("From", "").replace("whatsapp:", "")
+            from_number = form_data.get("From", "").removeprefix("whatsapp:")
             body = form_data.get("Body", "")
             message_sid = form_data.get("MessageSid", "")
             profile_name = form_data.get("ProfileName", "")
             
+            # Not a Twilio message (empty body, health check, other JSON)
+            if not from_number or not message_sid:
+                return None
+            
             # Check for media (images, audio)
             num_media = int(form_data.get("NumMedia", "0"))
             
@@ -112,29 +237,14 @@ class TwilioWhatsAppService:
                 media_content_type = form_data.get("MediaContentType0", "")
                 media_url = form_data.get("MediaUrl0", "")
                 
-                # Determine message type based on content type
-                if media_content_type.startswith("image/"):
-                    parsed["type"] = "image"
-                    parsed["media_url"] = media_url
-                    parsed["mime_type"] = media_content_type
-                    parsed["caption"] = body  # Text sent with image
-                    
-                elif media_content_type.startswith("audio/"):
-                    parsed["type"] = "audio"
-                    parsed["media_url"] = media_url
-                    parsed["mime_type"] = media_content_type
-                    
-                elif media_content_type.startswith("video/"):
-                    parsed["type"] = "video"
-                    parsed["media_url"] = media_url
-                    parsed["mime_type"] = media_content_type
-                    parsed["caption"] = body
-                    
-                else:
-                    # Unknown media type, treat as document
-                    parsed["type"] = "document"
-                    parsed["media_url"] = media_url
-                    parsed["mime_type"] = media_content_type
+                # Determine message type from the MIME major type
+                # (unknown media types are treated as documents)
+                kind, sep, _ = media_content_type.partition("/")
+                parsed["type"] = _MEDIA_TYPE.get(kind, "document") if sep else "document"
+                parsed["media_url"] = media_url
+                parsed["mime_type"] = media_content_type
+                if parsed["type"] in _CAPTIONED_TYPES:
+                    parsed["caption"] = body  # Text sent with image/video
                     
                 logger.info(f"Parsed {parsed['type']} message with media: {media_url}")
                 
@@ -150,5 +260,14 @@ class TwilioWhatsAppService:
             return None
 
 
-# Singleton instance
-twilio_whatsapp = TwilioWhatsAppService()
\ No newline at end of file
+# Lazy singleton: built on first use inside the running app, not at import
+@lru_cache(maxsize=1)
+def get_twilio() -> TwilioWhatsAppService:
+    return TwilioWhatsAppService()
+
+
+def __getattr__(name: str):
+    # Backward compatible `twilio_whatsapp` module attribute
+    if name == "twilio_whatsapp":
+        return get_twilio()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
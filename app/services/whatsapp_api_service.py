@@ -2,12 +2,60 @@
 WhatsApp API Service
 Third-party WhatsApp integration via CRM
 """
+import aiofiles
+import asyncio
+import gzip
 import httpx
+import os
+import time
+from functools import lru_cache
 import logging
-from typing import Dict, Optional, List
+import orjson
+from typing import Dict, Optional, List, Tuple, Union
+
+from app.config import settings
+from app.schemas.payload_types import (
+    Interactive, Media, WebhookPayload, convert_webhook, decode_webhook
+)
+from app.services._bulk import run_bounded
+from app.services._http import get_transport
+from app.services._retry import retry_async
+from app.services.rate_limit import get_whatsapp_limiter
 
 logger = logging.getLogger(__name__)
 
+# Chunk size for streaming media downloads to disk
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+# Outbound JSON bodies above this size are sent gzip-encoded
+GZIP_MIN_BYTES = 1024
+_GZIP_HEADERS = {"Content-Encoding": "gzip"}
+
+# Webhook bodies above this size are decoded in a worker thread, off the event loop
+WEBHOOK_OFFLOAD_BYTES = 16 * 1024
+
+# Characters dropped from phone numbers before they go to the API
+_PHONE_STRIP = str.maketrans("", "", "+ -()")
+
+
+# Inbound message types carrying a caption / a downloadable media object
+_CAPTION_TYPES = frozenset({"image", "video", "document"})
+_MEDIA_TYPES = frozenset({"image", "audio", "video", "document"})
+# Stand-ins for a missing type-specific object (all fields at their defaults)
+_NO_MEDIA = Media()
+_NO_INTERACTIVE = Interactive()
+
+
+@lru_cache(maxsize=256)
+def _format_buttons(key: Tuple[Tuple[str, str], ...]) -> Tuple[Dict, ...]:
+    """Reply-button objects for (id, title) pairs; cached, so never mutate the result"""
+    return tuple({"type": "reply", "reply": {"id": btn_id, "title": title}} for btn_id, title in key)
+
+
+def _normalize_phone(phone: str) -> str:
+    """Bare digits for the API (27821234567), in one translate pass"""
+    return phone.translate(_PHONE_STRIP)
+
 
 class WhatsAppAPIService:
     """
@@ -15,29 +63,66 @@ class WhatsAppAPIService:
     """
     
     def __init__(self):
-        from app.config import settings
         self.base_url = settings.WHATSAPP_API_URL
         self.api_key = settings.WHATSAPP_API_KEY
         self.phone_number_id = settings.WHATSAPP_PHONE_NUMBER_ID
         self.version = "v19.0"
+        # Quota limiter shared with WhatsAppService (same number, same quota)
+        self._limiter = get_whatsapp_limiter()
+        self.messages_path = f"/{self.phone_number_id}/messages"
+        # Static per-process values, built once instead of per call
+        self._headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        self._media_url_prefix = f"{self.base_url}/{self.version}/"
+        
+        # Client over the shared pooled HTTP/2 transport (app/services/_http.py).
+        # Auth/content-type ride along as default headers.
+        self._client = httpx.AsyncClient(
+            base_url=f"{self.base_url}/{self.version}",
+            headers=self._headers,
+            transport=get_transport(),
+            timeout=30.0
+        )
     
-    async def send_typing_indicator(self, to_phone: str, duration: int = 2) -> None:
+    async def warm_up(self) -> None:
+        """Open the TLS/HTTP2 connection at startup so the first reply skips the handshake."""
+        try:
+            await self._client.get("/", timeout=5.0)
+        except Exception as e:
+            logger.warning(f"WhatsApp API warm-up failed: {str(e)}")
+    
+    async def _post_message(self, payload: Dict) -> httpx.Response:
+        """POST to the messages endpoint (rate-limited), retrying only failures the API never processed (no double sends)."""
+        # Serialize once (orjson -> bytes); retries resend the same body
+        body = orjson.dumps(payload)
+        headers = None
+        if len(body) > GZIP_MIN_BYTES:
+            # Large bodies (Flows, long button texts) go gzipped; level 1 is cheap
+            body = gzip.compress(body, compresslevel=1)
+            headers = _GZIP_HEADERS
+        
+        async def post():
+            async with self._limiter.slot():
+                started = time.monotonic()
+                response = await self._client.post(self.messages_path, content=body, headers=headers)
+                self._limiter.observe(response, time.monotonic() - started)
+            response.raise_for_status()
+            return response
+        
+        return await retry_async(post)
+    
+    async def send_typing_indicator(self, to_phone: str) -> None:
         """
-        Show typing indicator (...) to user.
+        Show typing indicator (...) to user. Best effort and off the reply
+        path: replies never wait on it.
         
         Args:
             to_phone: Recipient phone
-            duration: How long to show typing (seconds)
         """
         try:
-            import asyncio
-            
-            phone = to_phone.replace("+", "").replace(" ", "")
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            phone = _normalize_phone(to_phone)
             
             # Send typing indicator
             payload = {
@@ -47,23 +132,18 @@ class WhatsAppAPIService:
                 "type": "typing"
             }
             
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                await client.post(
-                    f"{self.base_url}/{self.version}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=headers
-                )
-            
-            # Wait for specified duration
-            await asyncio.sleep(duration)
+            async with self._limiter.slot():
+                started = time.monotonic()
+                response = await self._client.post(self.messages_path, content=orjson.dumps(payload), timeout=10.0)
+                self._limiter.observe(response, time.monotonic() - started)
+            response.raise_for_status()
             
             logger.info(f"Typing indicator shown to {phone}")
             
         except Exception as e:
             logger.error(f"Failed to send typing indicator: {str(e)}")
             # Don't raise - typing is optional
-
-
+    
     async def send_message(self, to_phone: str, message: str) -> Dict:
         """
         Send WhatsApp message via Cloud API.
@@ -77,13 +157,7 @@ class WhatsAppAPIService:
         """
         try:
             # Clean phone number - remove + if present
-            phone = to_phone.replace("+", "").replace(" ", "")
-            
-            # WhatsApp Cloud API format
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            phone = _normalize_phone(to_phone)
             
             # Payload per WhatsApp Cloud API docs
             payload = {
@@ -95,17 +169,11 @@ class WhatsAppAPIService:
                 }
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/{self.version}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=headers
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                logger.info(f"Message sent to {phone}: Success")
-                return result
+            response = await self._post_message(payload)
+            result = response.json()
+            
+            logger.info(f"Message sent to {phone}: Success")
+            return result
                 
         except httpx.HTTPStatusError as e:
             logger.error(f"WhatsApp API error: {e.response.text}")
@@ -114,16 +182,25 @@ class WhatsAppAPIService:
             logger.error(f"Failed to send message: {str(e)}")
             raise
     
-    async def send_delay(self, duration: float = 1.5) -> None:
+    async def send_messages_bulk(
+        self,
+        items: List[Tuple[str, str]],
+        concurrency: int = 50
+    ) -> List[Union[Dict, BaseException]]:
         """
-        Add natural delay before sending message (simulates typing).
-        No visible indicator, just pause.
+        Send many text messages concurrently over the pooled connections.
         
         Args:
-            duration: Seconds to wait
+            items: (to_phone, message) pairs
+            concurrency: Max sends in flight at once
+            
+        Returns:
+            One entry per item, in order: the API response, or the exception
+            that send_message raised for that item (failures don't abort the rest)
         """
-        import asyncio
-        await asyncio.sleep(duration)
+        # Fixed pool of workers over the pooled connections; see run_bounded
+        # for why there is no per-message yield
+        return await run_bounded(self.send_message, items, concurrency)
     
     async def send_buttons(self, to_phone: str, body_text: str, buttons: List[Dict]) -> Dict:
         """
@@ -138,12 +215,7 @@ class WhatsAppAPIService:
             Response from API
         """
         try:
-            phone = to_phone.replace("+", "").replace(" ", "")
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            phone = _normalize_phone(to_phone)
             
             # Interactive buttons payload
             payload = {
@@ -161,17 +233,11 @@ class WhatsAppAPIService:
                 }
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/{self.version}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=headers
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                logger.info(f"Buttons sent to {phone}: Success")
-                return result
+            response = await self._post_message(payload)
+            result = response.json()
+            
+            logger.info(f"Buttons sent to {phone}: Success")
+            return result
                 
         except Exception as e:
             logger.error(f"Failed to send buttons: {str(e)}")
@@ -181,7 +247,8 @@ class WhatsAppAPIService:
     @staticmethod
     def parse_webhook(data: Dict) -> Optional[Dict]:
         """
-        Parse incoming webhook from WhatsApp API.
+        Parse an already-decoded webhook dict (kept for callers holding a
+        dict; parse_webhook_bytes is the fast path).
         
         Returns:
             {
@@ -198,62 +265,7 @@ class WhatsAppAPIService:
         try:
             # WhatsApp Cloud API format
             if "entry" in data:
-                entry = data.get("entry", [{}])[0]
-                changes = entry.get("changes", [{}])[0]
-                value = changes.get("value", {})
-                
-                messages = value.get("messages", [])
-                if not messages:
-                    return None
-                
-                message = messages[0]
-                contacts = value.get("contacts", [{}])[0]
-                
-                # Extract phone number (add country code if not present)
-                from_phone = message.get("from", "")
-                if from_phone and not from_phone.startswith("+"):
-                    from_phone = f"+{from_phone}"
-                
-                message_type = message.get("type", "text")
-                
-                result = {
-                    "from_phone": from_phone,
-                    "from_name": contacts.get("profile", {}).get("name", ""),
-                    "message_id": message.get("id", ""),
-                    "type": message_type,
-                    "text": message.get("text", {}).get("body", "") if message_type == "text" else "",
-                    "caption": message.get(message_type, {}).get("caption", "") if message_type in ["image", "video", "document"] else "",
-                    "timestamp": message.get("timestamp", "")
-                }
-                
-                # Handle button clicks (interactive type)
-                if message_type == "interactive":
-                    interactive = message.get("interactive", {})
-                    
-                    # Check if it's a Flow response
-                    if interactive.get("type") == "nfm_reply":
-                        nfm_reply = interactive.get("nfm_reply", {})
-                        response_json = nfm_reply.get("response_json", "{}")
-                        result["text"] = "FLOW_RESPONSE"
-                        result["flow_data"] = response_json  # Store Flow data
-                        result["type"] = "text"
-                        logger.info(f"Flow response received: {response_json[:100]}")
-                    else:
-                        # Regular button click
-                        button_reply = interactive.get("button_reply", {})
-                        result["text"] = button_reply.get("id", "")
-                        result["type"] = "text"
-                        logger.info(f"Button clicked: {result['text']}")
-                
-                # Handle media - get media_id to fetch URL later
-                if message_type in ["image", "audio", "video", "document"]:
-                    media = message.get(message_type, {})
-                    result["media_id"] = media.get("id", "")
-                    result["mime_type"] = media.get("mime_type", "")
-                    # Note: media_url will be fetched using media_id in download_media function
-                
-                logger.info(f"Parsed webhook: type={message_type}, media_id={result.get('media_id', 'none')}")
-                return result
+                return WhatsAppAPIService._parse_payload(convert_webhook(data))
             
             # Fallback for other formats
             return None
@@ -261,6 +273,96 @@ class WhatsAppAPIService:
         except Exception as e:
             logger.error(f"Webhook parsing error: {str(e)}")
             return None
+    
+    @staticmethod
+    def parse_webhook_bytes(raw: bytes) -> Optional[Dict]:
+        """
+        Decode and parse a raw webhook body in one msgspec pass.
+        Same result shape as parse_webhook.
+        
+        Raises:
+            msgspec.DecodeError: body isn't a Cloud API JSON payload
+        """
+        payload = decode_webhook(raw)
+        try:
+            return WhatsAppAPIService._parse_payload(payload)
+        except Exception as e:
+            logger.error(f"Webhook parsing error: {str(e)}")
+            return None
+    
+    @staticmethod
+    async def parse_webhook_bytes_async(raw: bytes) -> Optional[Dict]:
+        """
+        parse_webhook_bytes, run in a worker thread for bodies over
+        WEBHOOK_OFFLOAD_BYTES; small bodies stay inline (a thread hop costs more).
+        """
+        if len(raw) <= WEBHOOK_OFFLOAD_BYTES:
+            return WhatsAppAPIService.parse_webhook_bytes(raw)
+        return await asyncio.to_thread(WhatsAppAPIService.parse_webhook_bytes, raw)
+    
+    @staticmethod
+    def _parse_payload(payload: WebhookPayload) -> Optional[Dict]:
+        """Flatten the first message of a typed payload into the parsed-message dict."""
+        if not payload.entry or not payload.entry[0].changes:
+            return None
+        value = payload.entry[0].changes[0].value
+        
+        if not value.messages:
+            return None
+        
+        message = value.messages[0]
+        from_name = (value.contacts[0].profile.name or "") if value.contacts else ""
+        
+        # Extract phone number (add country code if not present)
+        from_phone = message.from_ or ""
+        if from_phone and from_phone[0] != "+":
+            from_phone = "+" + from_phone
+        
+        message_type = message.type or ""
+        
+        result = {
+            "from_phone": from_phone,
+            "from_name": from_name,
+            "message_id": message.id,
+            "type": message_type,
+            "text": (message.text.body or "") if message_type == "text" and message.text else "",
+            "caption": "",
+            "timestamp": str(message.timestamp) if message.timestamp is not None else ""
+        }
+        
+        # Handle button clicks (interactive type)
+        if message_type == "interactive":
+            interactive = message.interactive or _NO_INTERACTIVE
+            # Check if it's a Flow response
+            if interactive.type == "nfm_reply":
+                response_json = interactive.nfm_reply.response_json or ""
+                result["text"] = "FLOW_RESPONSE"
+                # Decode once here; consumers get a dict (None if malformed)
+                try:
+                    result["flow_data"] = orjson.loads(response_json) if response_json else {}
+                except orjson.JSONDecodeError:
+                    logger.error(f"Malformed Flow response JSON: {response_json[:100]}")
+                    result["flow_data"] = None
+                result["type"] = "text"
+                logger.info(f"Flow response received: {response_json[:100]}")
+            else:
+                # Regular button click
+                result["text"] = interactive.button_reply.id
+                result["type"] = "text"
+                logger.info(f"Button clicked: {result['text']}")
+        
+        # Handle media - get media_id to fetch URL later
+        elif message_type in _MEDIA_TYPES:
+            media = getattr(message, message_type) or _NO_MEDIA
+            if message_type in _CAPTION_TYPES:
+                result["caption"] = media.caption or ""
+            result["media_id"] = media.id
+            result["mime_type"] = media.mime_type
+            # Note: media_url will be fetched using media_id in download_media function
+        
+        logger.info(f"Parsed webhook: type={message_type}, media_id={result.get('media_id', 'none')}")
+        return result
+    
     async def send_quick_replies(self, to_phone: str, body_text: str, buttons: List[Dict]) -> Dict:
         """
         Send message with quick reply buttons (up to 3).
@@ -275,23 +377,13 @@ class WhatsAppAPIService:
             Response from API
         """
         try:
-            phone = to_phone.replace("+", "").replace(" ", "")
+            phone = _normalize_phone(to_phone)
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Format buttons for WhatsApp API
-            formatted_buttons = []
-            for btn in buttons[:3]:  # Max 3
-                formatted_buttons.append({
-                    "type": "reply",
-                    "reply": {
-                        "id": btn.get("id", "btn"),
-                        "title": btn.get("title", "Button")[:20]  # Max 20 chars
-                    }
-                })
+            # Format buttons for WhatsApp API (Max 3, titles max 20 chars);
+            # repeated menus hit the cache
+            formatted_buttons = _format_buttons(tuple(
+                (btn.get("id", "btn"), btn.get("title", "Button")[:20]) for btn in buttons[:3]
+            ))
             
             payload = {
                 "messaging_product": "whatsapp",
@@ -308,24 +400,17 @@ class WhatsAppAPIService:
                 }
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/{self.version}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=headers
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                logger.info(f"Quick replies sent to {phone}")
-                return result
+            response = await self._post_message(payload)
+            result = response.json()
+            
+            logger.info(f"Quick replies sent to {phone}")
+            return result
                 
         except Exception as e:
             logger.error(f"Failed to send quick replies: {str(e)}")
             # Fallback to text
             return await self.send_message(to_phone, body_text)
-
-
+    
     async def get_media_url(self, media_id: str) -> Optional[str]:
         """
         Get media URL from media_id.
@@ -341,13 +426,53 @@ class WhatsAppAPIService:
         try:
             # For this CRM, the media endpoint returns the file directly
             # So we construct the URL and return it for download_media to use
-            media_url = f"{self.base_url}/{self.version}/{media_id}"
+            media_url = self._media_url_prefix + media_id
             logger.info(f"Media URL constructed: {media_url}")
             return media_url
                 
         except Exception as e:
             logger.error(f"Failed to construct media URL: {str(e)}")
             return None
+    
+    async def download_media(self, media_id: str, dest_path: Union[str, os.PathLike]) -> Union[str, os.PathLike]:
+        """
+        Download media by media_id, streaming it to dest_path.
+        
+        Args:
+            media_id: Media ID from webhook
+            dest_path: File to write
+            
+        Returns:
+            dest_path
+        """
+        media_url = await self.get_media_url(media_id)
+        if not media_url:
+            raise ValueError(f"No media URL for media_id {media_id}")
+        return await self.download_url(media_url, dest_path)
+    
+    async def download_url(self, media_url: str, dest_path: Union[str, os.PathLike]) -> Union[str, os.PathLike]:
+        """
+        Stream a media URL to dest_path in MEDIA_CHUNK_SIZE chunks, so memory
+        stays flat regardless of file size. Follows the CDN redirect.
+        A partial file is removed if the download fails.
+        
+        Returns:
+            dest_path
+        """
+        try:
+            async with self._client.stream("GET", media_url, follow_redirects=True) as response:
+                response.raise_for_status()
+                async with aiofiles.open(dest_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(MEDIA_CHUNK_SIZE):
+                        await f.write(chunk)
+        except Exception:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            raise
+        
+        logger.info(f"Media downloaded: {dest_path}")
+        return dest_path
+    
     async def send_flow(self, to_phone: str, body_text: str, button_text: str, flow_id: str) -> Dict:
         """
         Send WhatsApp Flow (interactive form).
@@ -362,12 +487,7 @@ class WhatsAppAPIService:
             Response from API
         """
         try:
-            phone = to_phone.replace("+", "").replace(" ", "")
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            phone = _normalize_phone(to_phone)
             
             # Flow message payload
             payload = {
@@ -395,17 +515,11 @@ class WhatsAppAPIService:
                 }
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/{self.version}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=headers
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                logger.info(f"Flow sent to {phone}: Success")
-                return result
+            response = await self._post_message(payload)
+            result = response.json()
+            
+            logger.info(f"Flow sent to {phone}: Success")
+            return result
                 
         except Exception as e:
             logger.error(f"Failed to send flow: {str(e)}")
@@ -417,5 +531,14 @@ class WhatsAppAPIService:
             )
 
 
-# Singleton instance
-whatsapp_api = WhatsAppAPIService()
\ No newline at end of file
+# Lazy singleton: built on first use inside the running app, not at import
+@lru_cache(maxsize=1)
+def get_whatsapp_api() -> WhatsAppAPIService:
+    return WhatsAppAPIService()
+
+
+def __getattr__(name: str):
+    # Backward compatible `whatsapp_api` module attribute
+    if name == "whatsapp_api":
+        return get_whatsapp_api()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
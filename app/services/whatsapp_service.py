@@ -2,17 +2,113 @@
 WhatsApp Service
 Handles all WhatsApp Business API interactions
 """
+import asyncio
+import hmac
 import httpx
 import logging
-from typing import Dict, Optional, List
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Iterator, Optional, List, Tuple, Union
 import aiofiles
+import orjson
+from cachetools import TTLCache
 import os
-from datetime import datetime
+import time
+import weakref
 
 from app.config import settings
+from app.services._bulk import run_bounded
+from app.services._http import get_transport
+from app.services._retry import RETRYABLE_STATUSES, SAFE_RETRY_STATUSES, retry_async
+from app.services.rate_limit import get_whatsapp_limiter
 
 logger = logging.getLogger(__name__)
 
+# Chunk size for streaming media downloads to disk
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+# Webhook bodies above this size are parsed in a worker thread, off the event loop
+WEBHOOK_OFFLOAD_BYTES = 16 * 1024
+
+# File extensions for the media types WhatsApp sends (others fall back to the subtype)
+_MIME_EXT = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "audio/ogg": "ogg",
+    "audio/mpeg": "mp3",
+    "audio/mp4": "m4a",
+    "audio/aac": "aac",
+    "audio/amr": "amr",
+    "video/mp4": "mp4",
+    "video/3gpp": "3gp",
+    "application/pdf": "pdf",
+    "text/plain": "txt",
+}
+
+# Bytes batched per aiofiles write (each write is a thread-pool round trip)
+MEDIA_WRITE_BATCH = 1024 * 1024
+
+# Characters dropped from recipient numbers, in one translate pass
+_PHONE_STRIP = str.maketrans("", "", "+ -")
+
+# Request timeouts are worth retrying here too (idempotent requests only)
+_RETRY_STATUSES = RETRYABLE_STATUSES | {408}
+
+# Parsed webhooks by message id: WhatsApp redelivers until acked, so skip re-walking
+# the same payload; short TTL keeps it a retry window, not a message store
+_parse_cache: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+
+# Fields copied per message type: (parsed key, key in the type's sub-object, default)
+_MESSAGE_FIELDS = {
+    "text": (("text", "body", ""),),
+    "image": (("media_id", "id", None), ("mime_type", "mime_type", None), ("caption", "caption", "")),
+    "audio": (("media_id", "id", None), ("mime_type", "mime_type", None)),
+    "video": (("media_id", "id", None), ("mime_type", "mime_type", None), ("caption", "caption", "")),
+    "document": (("media_id", "id", None), ("mime_type", "mime_type", None), ("filename", "filename", "")),
+    "button": (("button_payload", "payload", None), ("button_text", "text", None)),
+}
+
+
+def _iter_messages(webhook_data: Dict) -> Iterator[Tuple[Dict, Dict]]:
+    """(message, sender contact) for every inbound message in a webhook, in order"""
+    for entry in webhook_data.get("entry", ()):
+        for change in entry.get("changes", ()):
+            value = change.get("value", {})
+            messages = value.get("messages")
+            if not messages:
+                continue
+            contact = value["contacts"][0]
+            for message in messages:
+                yield message, contact
+
+
+def _message_fields(message: Dict, contact: Dict) -> Dict:
+    """Flat fields for one message: the parse_webhook_message dict / handler kwargs"""
+    fields = {
+        "message_id": message.get("id"),
+        "from_phone": message.get("from"),
+        "from_name": contact.get("profile", {}).get("name", ""),
+        "timestamp": message.get("timestamp"),
+        "type": message.get("type"),
+    }
+    
+    msg_type = fields["type"]
+    if msg_type == "interactive":
+        interactive = message.get("interactive") or {}
+        fields["interactive_type"] = interactive.get("type")
+        
+        if fields["interactive_type"] == "button_reply":
+            button_reply = interactive.get("button_reply") or {}
+            fields["button_id"] = button_reply.get("id")
+            fields["button_title"] = button_reply.get("title")
+    else:
+        # One lookup for the type's sub-object, then one get per field
+        sub = message.get(msg_type) or {}
+        for out_key, in_key, default in _MESSAGE_FIELDS.get(msg_type, ()):
+            fields[out_key] = sub.get(in_key, default)
+    
+    return fields
+
 
 class WhatsAppService:
     """
@@ -27,16 +123,104 @@ class WhatsAppService:
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json"
         }
+        # Client over the shared transport, created by startup() inside the running loop
+        self._client: Optional[httpx.AsyncClient] = None
+        self.messages_path = f"/{self.phone_number_id}/messages"
+        # Paces sends under the Cloud API quota and backs off when throttled
+        self._limiter = get_whatsapp_limiter()
+        # Bounds concurrent media downloads (and their write buffers) under bursts
+        self._download_slots = asyncio.Semaphore(settings.WHATSAPP_MAX_DOWNLOADS)
+        # Responses by caller idempotency key, plus one lock per key in flight
+        self._sent: TTLCache = TTLCache(maxsize=100_000, ttl=3600)
+        self._send_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    async def startup(self) -> None:
+        """Open the client (called on application startup)."""
+        if self._client is None:
+            # Shared HTTP/2 transport: sends multiplex over the same Graph API
+            # connection as WhatsAppAPIService instead of a second pool
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                headers=self.headers,
+                transport=get_transport(),
+                timeout=httpx.Timeout(30.0, connect=5.0)
+            )
+    
+    async def aclose(self) -> None:
+        """Drop the client (called on application shutdown; _http.aclose() closes the pool)."""
+        self._client = None
+    
+    async def _post_with_retry(
+        self,
+        path: str,
+        payload: Dict,
+        *,
+        max_attempts: int = 3,
+        idempotency_key: Optional[str] = None,
+        idempotent: bool = False
+    ) -> Dict:
+        """
+        POST through the rate limiter (0.5s doubling to 8s, Retry-After
+        honoured). Returns the JSON body.
+        
+        Plain sends only retry failures the server never processed (connect
+        errors, 429/503). Keyed or idempotent requests also retry 408/5xx and
+        read timeouts.
+        
+        With an idempotency_key, a repeat within the hour returns the first
+        send's response, and concurrent duplicates share one upstream POST.
+        """
+        if idempotency_key is None:
+            return await self._post(path, payload, max_attempts, idempotent)
+        
+        cached = self._sent.get(idempotency_key)
+        if cached is not None:
+            return cached
+        
+        lock = self._send_locks.get(idempotency_key)
+        if lock is None:
+            lock = self._send_locks[idempotency_key] = asyncio.Lock()
+        async with lock:
+            cached = self._sent.get(idempotency_key)
+            if cached is not None:
+                logger.info(f"Duplicate send skipped: {idempotency_key}")
+                return cached
+            result = await self._post(path, payload, max_attempts, True)
+            self._sent[idempotency_key] = result
+            return result
+    
+    async def _post(self, path: str, payload: Dict, max_attempts: int, idempotent: bool) -> Dict:
+        # Serialize once (orjson -> bytes); Content-Type is a client default header
+        body = orjson.dumps(payload)
+        
+        async def post():
+            async with self._limiter.slot():
+                started = time.monotonic()
+                response = await self._client.post(path, content=body)
+                self._limiter.observe(response, time.monotonic() - started)
+            response.raise_for_status()
+            return response
+        
+        response = await retry_async(
+            post,
+            max_retries=max_attempts,
+            base=0.5,
+            cap=8.0,
+            retry_statuses=_RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES,
+            idempotent=idempotent
+        )
+        return orjson.loads(response.content)
     
     async def send_text_message(
         self, 
         to_phone: str, 
         message: str,
-        preview_url: bool = False
+        preview_url: bool = False,
+        idempotency_key: Optional[str] = None
     ) -> Dict:
         """Send a text message to a WhatsApp user."""
         try:
-            clean_phone = to_phone.replace("+", "").replace(" ", "").replace("-", "")
+            clean_phone = to_phone.translate(_PHONE_STRIP)
             
             payload = {
                 "messaging_product": "whatsapp",
@@ -49,18 +233,12 @@ class WhatsAppService:
                 }
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                logger.info(f"Message sent to {clean_phone}: {result.get('messages', [{}])[0].get('id')}")
-                return result
+            result = await self._post_with_retry(
+                self.messages_path, payload, idempotency_key=idempotency_key
+            )
+            
+            logger.info(f"Message sent to {clean_phone}: {result.get('messages', [{}])[0].get('id')}")
+            return result
                 
         except httpx.HTTPStatusError as e:
             logger.error(f"WhatsApp API error: {e.response.text}")
@@ -69,16 +247,36 @@ class WhatsAppService:
             logger.error(f"Failed to send message: {str(e)}")
             raise
     
+    async def broadcast_text(
+        self,
+        recipients: List[str],
+        message: str,
+        concurrency: int = 50
+    ) -> List[Union[Dict, BaseException]]:
+        """
+        Send one text message to many recipients, `concurrency` at a time
+        over the pooled client (the shared rate limiter still paces them).
+        
+        Returns a list aligned with `recipients`: the API response, or the
+        exception raised for that recipient. Never raises for a single failure.
+        """
+        return await run_bounded(
+            self.send_text_message,
+            [(to_phone, message) for to_phone in recipients],
+            concurrency
+        )
+    
     async def send_template_message(
         self,
         to_phone: str,
         template_name: str,
         language_code: str = "en",
-        components: Optional[List[Dict]] = None
+        components: Optional[List[Dict]] = None,
+        idempotency_key: Optional[str] = None
     ) -> Dict:
         """Send a pre-approved template message."""
         try:
-            clean_phone = to_phone.replace("+", "").replace(" ", "").replace("-", "")
+            clean_phone = to_phone.translate(_PHONE_STRIP)
             
             payload = {
                 "messaging_product": "whatsapp",
@@ -95,15 +293,9 @@ class WhatsAppService:
             if components:
                 payload["template"]["components"] = components
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
+            return await self._post_with_retry(
+                self.messages_path, payload, idempotency_key=idempotency_key
+            )
                 
         except Exception as e:
             logger.error(f"Failed to send template: {str(e)}")
@@ -115,12 +307,15 @@ class WhatsAppService:
         header_text: str,
         body_text: str,
         footer_text: str,
-        buttons: List[Dict]
+        buttons: List[Dict],
+        idempotency_key: Optional[str] = None
     ) -> Dict:
         """Send message with interactive buttons."""
         try:
-            clean_phone = to_phone.replace("+", "").replace(" ", "").replace("-", "")
+            clean_phone = to_phone.translate(_PHONE_STRIP)
             
+            # Length caps are plain slices: slicing a str that already fits returns
+            # the same object, so short labels cost no copy
             formatted_buttons = [
                 {
                     "type": "reply",
@@ -154,15 +349,9 @@ class WhatsAppService:
                 }
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
+            return await self._post_with_retry(
+                self.messages_path, payload, idempotency_key=idempotency_key
+            )
                 
         except Exception as e:
             logger.error(f"Failed to send interactive message: {str(e)}")
@@ -170,37 +359,48 @@ class WhatsAppService:
     
     async def download_media(self, media_id: str, save_dir: str = "media") -> str:
         """Download media file from WhatsApp."""
+        async with self._download_slots:
+            return await self._download_media(media_id, save_dir)
+    
+    async def _download_media(self, media_id: str, save_dir: str) -> str:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.api_url}/{media_id}",
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                media_data = response.json()
-                
-                media_url = media_data.get("url")
-                mime_type = media_data.get("mime_type", "")
-                
-                download_response = await client.get(
-                    media_url,
-                    headers=self.headers,
-                    timeout=60.0
-                )
+            response = await self._client.get(f"/{media_id}")
+            response.raise_for_status()
+            media_data = orjson.loads(response.content)
+            
+            media_url = media_data.get("url")
+            mime_type = media_data.get("mime_type", "")
+            
+            os.makedirs(save_dir, exist_ok=True)
+            
+            # Drop parameters ("audio/ogg; codecs=opus"), then table or subtype
+            base = mime_type.partition(";")[0].strip().lower()
+            extension = _MIME_EXT.get(base) or (base[base.rfind("/") + 1:] if "/" in base else "bin")
+            filename = f"{media_id}_{time.time_ns()}.{extension}"
+            filepath = os.path.join(save_dir, filename)
+            
+            # Stream to disk chunk by chunk - memory stays flat for large media.
+            # The lookaside CDN needs the bearer token too, so the client's default
+            # headers (set once at construction) are sent as-is
+            async with self._client.stream("GET", media_url, timeout=60.0) as download_response:
                 download_response.raise_for_status()
-                
-                os.makedirs(save_dir, exist_ok=True)
-                
-                extension = mime_type.split("/")[-1] if "/" in mime_type else "bin"
-                filename = f"{media_id}_{datetime.now().timestamp()}.{extension}"
-                filepath = os.path.join(save_dir, filename)
-                
+                # Batch chunks: one thread-pool hop per ~1 MiB, not per chunk.
+                # writelines hands over httpx's chunks as-is (no join/copy)
                 async with aiofiles.open(filepath, "wb") as f:
-                    await f.write(download_response.content)
-                
-                logger.info(f"Media downloaded: {filepath}")
-                return filepath
+                    batch: List[bytes] = []
+                    batched = 0
+                    async for chunk in download_response.aiter_bytes(MEDIA_CHUNK_SIZE):
+                        batch.append(chunk)
+                        batched += len(chunk)
+                        if batched >= MEDIA_WRITE_BATCH:
+                            await f.writelines(batch)
+                            batch.clear()
+                            batched = 0
+                    if batch:
+                        await f.writelines(batch)
+            
+            logger.info(f"Media downloaded: {filepath}")
+            return filepath
                 
         except Exception as e:
             logger.error(f"Failed to download media: {str(e)}")
@@ -215,92 +415,110 @@ class WhatsAppService:
                 "message_id": message_id
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/{self.phone_number_id}/messages",
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
+            # Marking read is idempotent upstream, so any transient failure may retry
+            return await self._post_with_retry(self.messages_path, payload, idempotent=True)
                 
         except Exception as e:
             logger.error(f"Failed to mark message read: {str(e)}")
             return {}
     
     @staticmethod
-    def parse_webhook_message(webhook_data: Dict) -> Optional[Dict]:
-        """Parse incoming webhook data from WhatsApp."""
+    def parse_webhook_message(webhook_data: Union[Dict, bytes]) -> Optional[Dict]:
+        """Parse incoming webhook data from WhatsApp (decoded dict or raw body bytes)."""
         try:
-            entry = webhook_data.get("entry", [])[0]
-            changes = entry.get("changes", [])[0]
-            value = changes.get("value", {})
-            
-            if "messages" not in value:
-                return None
-            
-            message = value["messages"][0]
-            contact = value["contacts"][0]
+            if isinstance(webhook_data, (bytes, bytearray)):
+                webhook_data = orjson.loads(webhook_data)
             
-            parsed = {
-                "message_id": message.get("id"),
-                "from_phone": message.get("from"),
-                "from_name": contact.get("profile", {}).get("name", ""),
-                "timestamp": message.get("timestamp"),
-                "type": message.get("type"),
-            }
+            try:
+                message_id = webhook_data["entry"][0]["changes"][0]["value"]["messages"][0]["id"]
+            except (KeyError, IndexError, TypeError):
+                message_id = None
             
-            if parsed["type"] == "text":
-                parsed["text"] = message.get("text", {}).get("body", "")
+            cached = _parse_cache.get(message_id) if message_id else None
+            if cached is not None:
+                return dict(cached)
             
-            elif parsed["type"] == "image":
-                parsed["media_id"] = message.get("image", {}).get("id")
-                parsed["mime_type"] = message.get("image", {}).get("mime_type")
-                parsed["caption"] = message.get("image", {}).get("caption", "")
-            
-            elif parsed["type"] == "audio":
-                parsed["media_id"] = message.get("audio", {}).get("id")
-                parsed["mime_type"] = message.get("audio", {}).get("mime_type")
-            
-            elif parsed["type"] == "video":
-                parsed["media_id"] = message.get("video", {}).get("id")
-                parsed["mime_type"] = message.get("video", {}).get("mime_type")
-                parsed["caption"] = message.get("video", {}).get("caption", "")
-            
-            elif parsed["type"] == "document":
-                parsed["media_id"] = message.get("document", {}).get("id")
-                parsed["mime_type"] = message.get("document", {}).get("mime_type")
-                parsed["filename"] = message.get("document", {}).get("filename", "")
-            
-            elif parsed["type"] == "button":
-                parsed["button_payload"] = message.get("button", {}).get("payload")
-                parsed["button_text"] = message.get("button", {}).get("text")
+            first = next(_iter_messages(webhook_data), None)
+            if first is None:
+                return None
             
-            elif parsed["type"] == "interactive":
-                interactive = message.get("interactive", {})
-                parsed["interactive_type"] = interactive.get("type")
-                
-                if parsed["interactive_type"] == "button_reply":
-                    parsed["button_id"] = interactive.get("button_reply", {}).get("id")
-                    parsed["button_title"] = interactive.get("button_reply", {}).get("title")
+            parsed = _message_fields(*first)
             
+            if message_id:
+                _parse_cache[message_id] = parsed
+                return dict(parsed)
             return parsed
             
-        except (KeyError, IndexError) as e:
+        except (KeyError, IndexError, orjson.JSONDecodeError) as e:
             logger.error(f"Failed to parse webhook: {str(e)}")
             return None
     
+    @staticmethod
+    async def dispatch_webhook(
+        webhook_data: Union[Dict, bytes],
+        handlers: Dict[str, Callable[..., Awaitable]]
+    ) -> int:
+        """
+        Call handlers[type](**fields) for every message in the webhook (not just
+        the first), straight from the payload - no parsed dict is kept or cached.
+        
+        fields are the keys parse_webhook_message returns for that type, so
+        handlers should accept **kwargs for any they ignore. Messages without a
+        handler are skipped. Returns the number of messages dispatched.
+        """
+        try:
+            if isinstance(webhook_data, (bytes, bytearray)):
+                webhook_data = orjson.loads(webhook_data)
+            # References into the payload only; handler errors must not be
+            # mistaken for parse errors, so walk before calling anything
+            messages = list(_iter_messages(webhook_data))
+        except (KeyError, IndexError, AttributeError, orjson.JSONDecodeError) as e:
+            logger.error(f"Failed to parse webhook: {str(e)}")
+            return 0
+        
+        dispatched = 0
+        for message, contact in messages:
+            handler = handlers.get(message.get("type"))
+            if handler is None:
+                continue
+            await handler(**_message_fields(message, contact))
+            dispatched += 1
+        return dispatched
+    
+    @staticmethod
+    async def parse_webhook_async(raw: bytes) -> Optional[Dict]:
+        """
+        parse_webhook_message for a raw body, run in a worker thread above
+        WEBHOOK_OFFLOAD_BYTES; small bodies stay inline (a thread hop costs more).
+        """
+        if len(raw) <= WEBHOOK_OFFLOAD_BYTES:
+            return WhatsAppService.parse_webhook_message(raw)
+        return await asyncio.to_thread(WhatsAppService.parse_webhook_message, raw)
+    
     @staticmethod
     def verify_webhook(mode: str, token: str, challenge: str) -> Optional[str]:
         """Verify webhook during setup."""
-        if mode == "subscribe" and token == settings.WHATSAPP_VERIFY_TOKEN:
+        # Constant-time compare, done once (bytes: compare_digest rejects non-ASCII str)
+        expected = settings.WHATSAPP_VERIFY_TOKEN
+        token_match = bool(token and expected) and hmac.compare_digest(
+            token.encode(), expected.encode()
+        )
+        if mode == "subscribe" and token_match:
             logger.info("Webhook verified successfully")
             return challenge
         
-        logger.warning(f"Webhook verification failed: mode={mode}, token_match={token == settings.WHATSAPP_VERIFY_TOKEN}")
+        logger.warning(f"Webhook verification failed: mode={mode}, token_match={token_match}")
         return None
 
 
-# Singleton instance
-whatsapp_service = WhatsAppService()
+# App-managed singleton: built on first use, its client opened by startup()
+@lru_cache(maxsize=1)
+def get_whatsapp_service() -> WhatsAppService:
+    return WhatsAppService()
+
+
+def __getattr__(name: str):
+    # Backward compatible `whatsapp_service` module attribute
+    if name == "whatsapp_service":
+        return get_whatsapp_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")